@@ -4,181 +4,67 @@ from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from datetime import datetime
 from dotenv import load_dotenv
 import os
-import requests
+import logging
 from flask_migrate import Migrate
 import json
-import csv
 from paises import PAISES_CODIGOS
+from cola_whatsapp import ColaWebhooks, ColaWhatsapp
+from whatsapp_cliente import ClienteWhatsapp
+from limitador import LimitadorDB, LimitadorMemoria
+from limite_http import LimiteHTTP, ip_cliente
+from tareas import TareaPeriodica
+from logs_estructurados import abrir_contexto, cerrar_contexto, configurar_logs, descartados, muestrear
+from metricas import BUCKETS_CONSULTAS, Metricas
+from cache_ttl import CacheTTL
+from config_db import estadisticas_pool, opciones_engine, resumen_opciones
+from sql_portable import borrar_en_lotes, insertar_si_no_existe, insertar_si_no_existe_y_luego
+from conteo_votos import NOMBRES_DIMENSIONES, Escrutinio
+import exportar_votos
+import click
+from datos_referencia import (
+    CANDIDATOS, GOBERNADORES, RECINTOS, RECINTOS_NIVELES, RECINTOS_PARAMS, REGISTRO,
+    estadisticas_normalizacion, limpiar_numero, respuesta_json
+)
 from flask import session
 from flask import render_template
 from flask_wtf import CSRFProtect
 from flask_wtf.csrf import CSRFProtect
-from flask import Flask, request, render_template, redirect, jsonify, session
+from flask import Flask, request, render_template, redirect, jsonify, session, Response, stream_with_context
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from datetime import datetime, timedelta
 from itsdangerous import URLSafeTimedSerializer
-import unicodedata
-import re
+import math
+import time
+import uuid
 import pandas as pd
 from flask import request, jsonify
 
 
 
-# ---------------------------
-# Loader de Candidatos por Municipio (CSV)
-# ---------------------------
-
-CANDIDATOS_CSV_PATH = os.path.join(os.path.dirname(__file__), "privado", "CandidatosPorMunicipio.csv")
-
-# Cache en memoria para no releer el CSV en cada request
-_CANDIDATOS_CACHE = {
-    "by_id_municipio": {},   # { "123": [ {candidato...}, ... ] }
-    "id_by_municipio": {},   # { "TARVITA": ["10","11"] }  (ojo: puede haber duplicados)
-    "loaded": False,
-    "error": None
-}
-
-def norm(s):
-    s = (s or "").strip()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = re.sub(r"\s+", " ", s)
-    return s.lower()
+# Cliente único (pool keep-alive) para todos los envíos a 360dialog
+cliente_whatsapp = ClienteWhatsapp()
 
 
-def _norm_text(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s).strip()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = s.upper()
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-
-def cargar_candidatos_desde_csv():
+def entregar_whatsapp(numero, mensaje):
     """
-    Lee privado/CandidatosPorMunicipio.csv y construye:
-    - by_id_municipio: lista de candidatos por id_municipio
-    - id_by_municipio: posible lista de ids por nombre de municipio (si hay nombres repetidos)
+    Envío real a 360dialog (lo usa la cola de salida).
+    Devuelve (ok, reintentable, detalle).
     """
-    global _CANDIDATOS_CACHE
-
-    _CANDIDATOS_CACHE["by_id_municipio"] = {}
-    _CANDIDATOS_CACHE["id_by_municipio"] = {}
-    _CANDIDATOS_CACHE["loaded"] = False
-    _CANDIDATOS_CACHE["error"] = None
-
-    if not os.path.exists(CANDIDATOS_CSV_PATH):
-        _CANDIDATOS_CACHE["error"] = f"No existe el archivo: {CANDIDATOS_CSV_PATH}"
-        return
-
-    try:
-        with open(CANDIDATOS_CSV_PATH, encoding="utf-8-sig") as f:
-            lector = csv.DictReader(f)
-
-            required = {
-                "id_municipio",
-                "municipio",
-                "id_nombre_completo",
-                "nombre_completo",
-                "id_organizacion_politica",
-                "organizacion_politica",
-                "id_cargo",
-                "cargo",
-            }
-            headers = set(lector.fieldnames or [])
-            faltantes = required - headers
-            if faltantes:
-                _CANDIDATOS_CACHE["error"] = f"Faltan columnas en CSV: {sorted(list(faltantes))}"
-                return
-
-            for row in lector:
-                id_mun = str(row.get("id_municipio") or "").strip()
-                mun = _norm_text(row.get("municipio"))
-
-                if not id_mun or not mun:
-                    continue
-
-                item = {
-                    "id_municipio": id_mun,
-                    "municipio": mun,
-                    "id_nombre_completo": str(row.get("id_nombre_completo") or "").strip(),
-                    "nombre_completo": (row.get("nombre_completo") or "").strip(),
-                    "id_organizacion_politica": str(row.get("id_organizacion_politica") or "").strip(),
-                    "organizacion_politica": (row.get("organizacion_politica") or "").strip(),
-                    "id_cargo": str(row.get("id_cargo") or "").strip(),
-                    "cargo": (row.get("cargo") or "").strip(),
-                }
-
-                _CANDIDATOS_CACHE["by_id_municipio"].setdefault(id_mun, []).append(item)
-
-                # Para resolver desde nombre (si hiciera falta)
-                _CANDIDATOS_CACHE["id_by_municipio"].setdefault(mun, [])
-                if id_mun not in _CANDIDATOS_CACHE["id_by_municipio"][mun]:
-                    _CANDIDATOS_CACHE["id_by_municipio"][mun].append(id_mun)
-
-        _CANDIDATOS_CACHE["loaded"] = True
-
-    except Exception as e:
-        _CANDIDATOS_CACHE["error"] = f"Error leyendo CandidatosPorMunicipio.csv: {str(e)}"
-
-
-def asegurar_candidatos_cargados():
-    """Carga el CSV una sola vez (cache)."""
-    if not _CANDIDATOS_CACHE["loaded"] and _CANDIDATOS_CACHE["error"] is None:
-        cargar_candidatos_desde_csv()
-
-
-# Cargar al iniciar (si falla, quedará error en cache y lo veremos por logs)
-
-
-
-
-
-def limpiar_numero(numero_raw):
-    """Devuelve SOLO dígitos. Ej: '59178194036' """
-    numero = unicodedata.normalize("NFKD", str(numero_raw))
-    numero = re.sub(r"\D", "", numero)
-    return numero
-
-
-
-def enviar_mensaje_whatsapp(numero, mensaje):
-    """Envía un mensaje por WhatsApp vía 360dialog."""
-    try:
-        token = os.environ.get("WABA_TOKEN")
-        if not token:
-            print("⚠️ WABA_TOKEN no está configurado.")
-            return False
-
-        resp = requests.post(
-            "https://waba-v2.360dialog.io/messages",
-            headers={
-                "Content-Type": "application/json",
-                "D360-API-KEY": token
-            },
-            json={
-                "messaging_product": "whatsapp",
-                "recipient_type": "individual",
-                "to": numero,
-                "type": "text",
-                "text": {"preview_url": False, "body": mensaje}
-            },
-            timeout=15
-        )
-        print("WhatsApp status:", resp.status_code, resp.text[:200])
-        return 200 <= resp.status_code < 300
-    except Exception as e:
-        print("❌ Error enviando WhatsApp:", str(e))
-        return False
-
+    return cliente_whatsapp.enviar_texto(numero, mensaje)
 
 
 # ---------------------------
 # Configuración inicial
 # ---------------------------
 load_dotenv()
+# Logs JSON por una cola en memoria (ver logs_estructurados.py)
+configurar_logs()
+log = logging.getLogger("votaciones")
+log_http = logging.getLogger("votaciones.http")
+log_whatsapp = logging.getLogger("votaciones.whatsapp")
+log_api = logging.getLogger("votaciones.api")
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "clave-super-secreta")
 app = Flask(__name__)
@@ -186,6 +72,7 @@ app.secret_key = SECRET_KEY
 
 csrf = CSRFProtect(app)
 serializer = URLSafeTimedSerializer(SECRET_KEY)
+TOKEN_VIDA_SEGUNDOS = 600  # validez del enlace de votación
 
 # ---------------------------
 # Configuración de la base de datos
@@ -193,17 +80,22 @@ serializer = URLSafeTimedSerializer(SECRET_KEY)
 db_url = os.environ.get("DATABASE_URL", "sqlite:///votos.db")
 app.config["SQLALCHEMY_DATABASE_URI"] = db_url
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Pool, timeouts y keepalives desde el entorno (ver config_db.py)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = opciones_engine(db_url)
+log.info("Base de datos configurada", extra={"db": resumen_opciones(db_url, app.config["SQLALCHEMY_ENGINE_OPTIONS"])})
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
 # ---------------------------
-# Cargar candidatos (1 sola vez)
+# Cargar datos de referencia: recintos, candidatos y gobernadores
+# (1 sola vez; se recargan si cambia el CSV o desde /admin/recargar_datos)
 # ---------------------------
-asegurar_candidatos_cargados()
-print("✅ CANDIDATOS loaded:", _CANDIDATOS_CACHE["loaded"])
-print("⚠️ CANDIDATOS error:", _CANDIDATOS_CACHE["error"])
-print("📌 CANDIDATOS path:", CANDIDATOS_CSV_PATH)
+REGISTRO.recargar()
+for _nombre, _estado in REGISTRO.estado().items():
+    if _estado["error"]:
+        log.warning("Dataset no disponible", extra={"dataset": _nombre, "error": _estado["error"]})
+log.info("Datos de referencia cargados", extra={"version_datos": REGISTRO.version()})
 
 
 
@@ -231,16 +123,47 @@ class Voto(db.Model):
     gobernador = db.Column(db.String(150), nullable=True)
 
     candidato = db.Column(db.String(100), nullable=False)
+
+    # Índices para auditoría/análisis (ver migrations/ y benchmark_indices.py)
+    __table_args__ = (
+        # votos por IP en una ventana de tiempo (fraude)
+        db.Index("ix_votos_ip_fecha", "ip", "fecha"),
+        # rangos de fecha (exportación, evolución en el tiempo)
+        db.Index("ix_votos_fecha", "fecha"),
+        # exportación / análisis por departamento en un rango de fechas
+        db.Index("ix_votos_departamento_fecha", "departamento", "fecha"),
+        # resultados de un municipio por candidato
+        db.Index("ix_votos_id_municipio_candidato", "id_municipio", "candidato"),
+        # votos desde las mismas coordenadas; parcial: la mayoría no trae ubicación
+        db.Index(
+            "ix_votos_latitud_longitud", "latitud", "longitud",
+            postgresql_where=db.text("latitud IS NOT NULL"),
+            sqlite_where=db.text("latitud IS NOT NULL"),
+        ),
+    )
     
     
 
 
+# ---------------------------
+# Conteos de votos (agregados incrementales, ver conteo_votos.py)
+# ---------------------------
+class ConteoVoto(db.Model):
+    __tablename__ = "conteo_votos"
+
+    dimension = db.Column(db.String(20), primary_key=True)
+    valor = db.Column(db.String(250), primary_key=True)
+    opcion = db.Column(db.String(150), primary_key=True)
+    fragmento = db.Column(db.Integer, primary_key=True, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+
 class NumeroTemporal(db.Model):
     __tablename__ = "numeros_temporales"
     id = db.Column(db.Integer, primary_key=True)
     numero = db.Column(db.String(50), unique=True, nullable=False, index=True)
     token = db.Column(db.Text, nullable=True)
-    fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # para el barrido
 
 
 class WhatsappMensajeProcesado(db.Model):
@@ -249,7 +172,7 @@ class WhatsappMensajeProcesado(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.String(120), unique=True, nullable=False, index=True)
     numero = db.Column(db.String(50), nullable=True)
-    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # para la retención
 
 # ---------------------------
 # Bloqueo WHatsapp
@@ -263,12 +186,291 @@ class BloqueoWhatsapp(db.Model):
     bloqueado = db.Column(db.Boolean, default=False)
 
 
+# ---------------------------
+# Cola de salida WhatsApp (ver cola_whatsapp.py)
+# ---------------------------
+class WhatsappMensajeSaliente(db.Model):
+    __tablename__ = "whatsapp_mensajes_salientes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    numero = db.Column(db.String(50), nullable=False)
+    texto = db.Column(db.Text, nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente/enviando/enviado/muerto
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    proximo_intento = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_error = db.Column(db.String(300), nullable=True)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    fecha_envio = db.Column(db.DateTime, nullable=True)
+    wamid = db.Column(db.String(120), nullable=True, index=True)  # id que devuelve WhatsApp
+    estado_entrega = db.Column(db.String(20), nullable=True)  # sent/delivered/read/failed (callbacks)
+
+    __table_args__ = (
+        db.Index("ix_whatsapp_salientes_estado_proximo", "estado", "proximo_intento"),
+    )
+
+
+# ---------------------------
+# Webhooks entrantes (payload crudo; se procesan en segundo plano)
+# ---------------------------
+class WhatsappWebhookRecibido(db.Model):
+    __tablename__ = "whatsapp_webhooks_recibidos"
+
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    host_url = db.Column(db.String(255), nullable=True)
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente/enviando/procesado/muerto
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    proximo_intento = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_error = db.Column(db.String(300), nullable=True)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_whatsapp_webhooks_estado_proximo", "estado", "proximo_intento"),
+    )
+
+
+# ---------------------------
+# Limitador de tasa compartido entre workers (token bucket, ver limitador.py)
+# ---------------------------
+class LimiteTasa(db.Model):
+    __tablename__ = "limites_tasa"
+
+    clave = db.Column(db.String(120), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    actualizado = db.Column(db.Float, nullable=False)  # epoch (segundos)
+
+
 
 with app.app_context():
     try:
         db.create_all()
     except Exception as e:
-        print("❌ Error db.create_all():", str(e))
+        log.error("Error en db.create_all()", extra={"error": str(e)})
+
+
+# "db" (compartido entre workers) o "memoria" (solo este proceso)
+if os.environ.get("LIMITADOR_BACKEND", "db") == "memoria":
+    limitador = LimitadorMemoria()
+else:
+    limitador = LimitadorDB(db, LimiteTasa)
+cliente_whatsapp.limitador = limitador
+
+cola_whatsapp = ColaWhatsapp(app, db, WhatsappMensajeSaliente, entregar_whatsapp)
+escrutinio = Escrutinio(db, ConteoVoto, Voto)
+
+# Límite de pedidos por IP / número (ver limite_http.py). Por defecto en
+# memoria: el tráfico abusivo se rechaza sin tocar la base.
+if os.environ.get("LIMITE_HTTP_BACKEND", "memoria") == "db":
+    limite_http = LimiteHTTP(LimitadorDB(db, LimiteTasa))
+else:
+    limite_http = LimiteHTTP(LimitadorMemoria())
+
+
+def respuesta_limite(regla, espera):
+    if regla == "api":
+        resp = jsonify({"error": "Demasiadas solicitudes, intenta más tarde."})
+    else:
+        resp = app.make_response(render_template("limite_ip.html"))
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(math.ceil(espera))
+    return resp
+
+
+def limitar_numero(regla, numero):
+    """
+    Devuelve la respuesta 429 si el número superó su límite, o None. En las
+    reglas que van primero por número (votar, enviar_voto) también aplica
+    aquí el límite por IP, que _limitar_por_ip no toca.
+    """
+    espera = limite_http.por_numero(regla, numero)
+    if espera > 0:
+        log_http.info("Límite por número", extra={"regla": regla, "numero": numero, "espera_s": round(espera, 1)})
+        return respuesta_limite(regla, espera)
+    if limite_http.numero_primero(regla):
+        return limitar_ip(regla)
+    return None
+
+
+def limitar_ip(regla):
+    ip = ip_cliente(request)
+    espera = limite_http.por_ip(regla, ip)
+    if espera > 0:
+        log_http.info("Límite por IP", extra={"regla": regla, "ip": ip, "espera_s": round(espera, 1)})
+        return respuesta_limite(regla, espera)
+    return None
+# procesar_webhook_whatsapp se define más abajo; se resuelve al llamar
+cola_webhooks = ColaWebhooks(app, db, WhatsappWebhookRecibido,
+                             lambda payload, host_url: procesar_webhook_whatsapp(payload, host_url))
+
+
+# ---------------------------
+# Métricas Prometheus (ver metricas.py): /metrics
+# ---------------------------
+metricas = Metricas()
+metricas.contador("http_peticiones_total", "Requests por endpoint, método y código HTTP")
+metricas.histograma("http_duracion_segundos", "Duración de los requests por endpoint")
+metricas.contador("db_consultas_total", "Consultas SQL (origen: request o fondo)")
+metricas.histograma("db_consulta_duracion_segundos", "Duración de cada consulta SQL")
+metricas.histograma("db_consultas_por_peticion", "Consultas SQL por request", BUCKETS_CONSULTAS)
+metricas.histograma("db_tiempo_por_peticion_segundos", "Tiempo en la base por request")
+metricas.histograma("whatsapp_api_duracion_segundos", "Latencia de las llamadas a 360dialog")
+metricas.contador("whatsapp_api_llamadas_total", "Llamadas a 360dialog por código HTTP")
+metricas.contador("api_datos_respuestas_total",
+                  "Respuestas de las APIs de CSV por resultado (no_modificado = 304 por ETag)")
+metricas.gauge("db_pool_conexiones", "Conexiones del pool de este worker")
+metricas.contador("db_pool_checkouts_total", "Conexiones pedidas al pool")
+metricas.contador("db_pool_esperas_total", "Checkouts que encontraron el pool lleno y esperaron")
+metricas.contador("db_pool_timeouts_total", "Checkouts del pool que agotaron el timeout")
+metricas.contador("cache_aciertos_total", "Aciertos de los caches en memoria")
+metricas.contador("cache_fallos_total", "Fallos de los caches en memoria")
+metricas.contador("logs_descartados_total", "Registros de log descartados por cola llena")
+cliente_whatsapp.metricas = metricas
+
+# Endpoints servidos desde los CSV en memoria (datos_referencia.py)
+ENDPOINTS_DATOS = ("api_recintos", "api_recintos_nivel", "api_candidatos", "api_gobernadores")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _metricas_antes_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metricas_inicio"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _metricas_despues_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("metricas_inicio", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    en_request = has_request_context()
+    origen = "request" if en_request else "fondo"
+    metricas.sumar("db_consultas_total", origen=origen)
+    metricas.observar("db_consulta_duracion_segundos", duracion, origen=origen)
+    if en_request:
+        g.db_consultas = g.get("db_consultas", 0) + 1
+        g.db_segundos = g.get("db_segundos", 0.0) + duracion
+
+
+def _metricas_inicio():
+    g.metricas_inicio = time.perf_counter()
+    # request_id del proxy (si es razonable) o uno nuevo; va en cada log del request
+    g.request_id = request_id_valido(request.headers.get("X-Request-ID")) or uuid.uuid4().hex
+    g.contexto_log = abrir_contexto(request_id=g.request_id, endpoint=request.endpoint)
+
+
+# Antes que cualquier otro before_request (CSRF, límites): también se miden los rechazos
+app.before_request_funcs.setdefault(None, []).insert(0, _metricas_inicio)
+
+
+def request_id_valido(valor):
+    valor = (valor or "").strip()
+    if 0 < len(valor) <= 64 and all(c.isalnum() or c in "-_.:" for c in valor):
+        return valor
+    return None
+
+
+# Log de acceso: todos los errores y requests lentos; del resto, una fracción
+LOG_MUESTREO_ACCESOS = float(os.environ.get("LOG_MUESTREO_ACCESOS", "1"))
+LOG_REQUEST_LENTO_MS = float(os.environ.get("LOG_REQUEST_LENTO_MS", "1000"))
+
+
+def registrar_acceso(resp, duracion):
+    ms = duracion * 1000
+    if resp.status_code >= 500 or ms >= LOG_REQUEST_LENTO_MS:
+        nivel = logging.WARNING
+    elif resp.status_code >= 400 or muestrear(LOG_MUESTREO_ACCESOS):
+        nivel = logging.INFO
+    else:
+        return
+    log_http.log(nivel, "%s %s %s", request.method, request.path, resp.status_code, extra={
+        "metodo": request.method,
+        "ruta": request.path,
+        "codigo": resp.status_code,
+        "duracion_ms": round(ms, 1),
+        "db_consultas": g.get("db_consultas", 0),
+        "db_ms": round(g.get("db_segundos", 0.0) * 1000, 1),
+    })
+
+
+@app.teardown_request
+def _cerrar_contexto_log(error=None):
+    token = g.pop("contexto_log", None)
+    if token is not None:
+        cerrar_contexto(token)
+
+
+@app.after_request
+def _metricas_fin(resp):
+    inicio = g.pop("metricas_inicio", None)
+    if inicio is None:
+        return resp
+    duracion = time.perf_counter() - inicio
+    resp.headers["X-Request-ID"] = g.request_id
+    registrar_acceso(resp, duracion)
+    endpoint = request.endpoint or "sin_ruta"
+    metricas.sumar("http_peticiones_total", endpoint=endpoint, metodo=request.method, codigo=resp.status_code)
+    metricas.observar("http_duracion_segundos", duracion, endpoint=endpoint)
+    metricas.observar("db_consultas_por_peticion", g.get("db_consultas", 0), endpoint=endpoint)
+    metricas.observar("db_tiempo_por_peticion_segundos", g.get("db_segundos", 0.0), endpoint=endpoint)
+    if endpoint in ENDPOINTS_DATOS:
+        if resp.status_code == 304:
+            resultado = "no_modificado"
+        elif resp.status_code != 200:
+            resultado = "error"
+        else:
+            resultado = resp.headers.get("Content-Encoding", "sin_comprimir")
+        metricas.sumar("api_datos_respuestas_total", endpoint=endpoint, resultado=resultado)
+    return resp
+
+
+@metricas.recolector
+def _metricas_caches(m):
+    # Los caches se definen más abajo; se resuelven al volcar
+    caches = {
+        "dedup_whatsapp": mensajes_procesados,
+        "bloqueados_whatsapp": numeros_bloqueados,
+        "no_autorizados_whatsapp": numeros_no_autorizados,
+    }
+    for nombre, cache in caches.items():
+        m.fijar("cache_aciertos_total", cache.aciertos, cache=nombre)
+        m.fijar("cache_fallos_total", cache.fallos, cache=nombre)
+    normalizacion = estadisticas_normalizacion()
+    m.fijar("cache_aciertos_total", normalizacion["aciertos"], cache="normalizacion_textos")
+    m.fijar("cache_fallos_total", normalizacion["fallos"], cache="normalizacion_textos")
+
+
+@metricas.recolector
+def _metricas_logs(m):
+    m.fijar("logs_descartados_total", descartados())
+
+
+@metricas.recolector
+def _metricas_pool(m):
+    with app.app_context():
+        pool = estadisticas_pool(db.engine)
+    if "en_uso" in pool:
+        m.fijar("db_pool_conexiones", pool["en_uso"], estado="en_uso")
+        m.fijar("db_pool_conexiones", pool["libres"], estado="libres")
+    if "esperas" in pool:
+        m.fijar("db_pool_checkouts_total", pool["checkouts"])
+        m.fijar("db_pool_esperas_total", pool["esperas"])
+        m.fijar("db_pool_timeouts_total", pool["timeouts"])
+
+
+@app.before_request
+def _limitar_por_ip():
+    regla = limite_http.regla_de(request.endpoint)
+    if regla is None or limite_http.numero_primero(regla):
+        return None  # votar / enviar_voto: ver limitar_numero
+    return limitar_ip(regla)
+
+
+@app.before_request
+def _arrancar_hilos_fondo():
+    # Con gunicorn cada worker arranca sus propios hilos (tras el fork)
+    cola_whatsapp.asegurar_hilos()
+    cola_webhooks.asegurar_hilos()
+    for tarea in TAREAS:
+        tarea.asegurar_hilo()
 
 
         
@@ -281,206 +483,493 @@ with app.app_context():
 @app.route('/whatsapp', methods=['POST'])
 @csrf.exempt
 def whatsapp_webhook():
+    # Solo se guarda el payload crudo y se responde: Meta/360dialog reintentan
+    # (y terminan desactivando el webhook) si el ack tarda. El lote completo
+    # se procesa en segundo plano (ver procesar_webhook_whatsapp).
+    payload = request.get_data(as_text=True)
+    if not payload:
+        return "ok", 200
+    if webhook_descartable(payload):
+        return "ok", 200  # solo mensajes de números bloqueados: ni se guarda
     try:
-        # Lee JSON seguro (no rompe si viene vacío)
-        data = request.get_json(force=True, silent=True) or {}
-        print("📥 JSON recibido:")
-        print(json.dumps(data, indent=2, ensure_ascii=False))
-
-        # ====== Normalización del payload (360dialog / Meta Cloud) ======
-        messages = None
-
-        # Formato Meta (Graph API): entry -> changes -> value -> messages
-        if isinstance(data, dict) and 'entry' in data:
-            try:
-                entry = (data.get('entry') or [])[0] or {}
-                changes = (entry.get('changes') or [])[0] or {}
-                value = changes.get('value', {}) or {}
-                messages = value.get('messages')
-            except Exception:
-                messages = None
-
-        # Formato "plano": { "messages": [...] }
-        if not messages and isinstance(data, dict) and 'messages' in data:
-            messages = data.get('messages')
-
-        # Si no hay mensajes no procesamos
-        if not messages:
-            print("ℹ️ Webhook sin 'messages'; no hay nada que procesar.")
-            return "ok", 200
-
-
-        # Tomamos el primer mensaje
-        msg = messages[0] or {}
-
-        # 1) número del remitente
-        numero_raw = msg.get("from") or msg.get("wa_id") or ""
-        numero_completo = limpiar_numero(numero_raw)
-
-        # 2) message_id
-        message_id = (msg.get("id") or "").strip()
+        cola_webhooks.encolar(payload, request.host_url, commit=False)
+        db.session.commit()
+        cola_webhooks.despertar()
+    except Exception as e:
+        db.session.rollback()
+        log_whatsapp.error("Error guardando webhook", extra={"error": str(e), "bytes": len(payload)})
+        return "error", 500  # el proveedor lo reintentará
+    return "ok", 200
 
-        # 3) deduplicación (una sola vez)
+
+# Dedup de message_id en este worker (LRU + TTL) antes de ir a la base
+mensajes_procesados = CacheTTL(
+    max_claves=int(os.environ.get("WHATSAPP_DEDUP_CACHE_MAX", "50000")),
+    ttl_segundos=float(os.environ.get("WHATSAPP_DEDUP_CACHE_TTL_SEGUNDOS", "3600")),
+)
+
+# Cache negativo de remitentes:
+# - bloqueados: sus mensajes se descartan sin tocar la base. El bloqueo
+#   nunca se revierte solo, así que una entrada no queda "vieja"; un fallo
+#   de cache solo cuesta la consulta de siempre. Se precarga desde la base
+#   cada tanto (tarea bloqueados_whatsapp) para que todos los workers los
+#   conozcan.
+# - no autorizados: tras enviar una advertencia, los mensajes del mismo
+#   número durante unos segundos no reciben otra. Se procesan igual (el
+#   intento cuenta para el bloqueo y, si el número se registró en otro
+#   worker, recibe su enlace): solo se omite la respuesta.
+numeros_bloqueados = CacheTTL(
+    max_claves=int(os.environ.get("WHATSAPP_BLOQUEADOS_CACHE_MAX", "100000")),
+    ttl_segundos=float(os.environ.get("WHATSAPP_BLOQUEADOS_CACHE_TTL_SEGUNDOS", "86400")),
+)
+numeros_no_autorizados = CacheTTL(
+    max_claves=int(os.environ.get("WHATSAPP_NO_AUTORIZADOS_CACHE_MAX", "50000")),
+    ttl_segundos=float(os.environ.get("WHATSAPP_NO_AUTORIZADOS_CACHE_TTL_SEGUNDOS", "10")),
+)
+
+
+def invalidar_cache_numero(numero):
+    """El número se registró (generar_link): vuelve a consultarse en la base."""
+    numeros_bloqueados.borrar(numero)
+    numeros_no_autorizados.borrar(numero)
+
+
+def webhook_descartable(payload):
+    """
+    True si el payload solo trae mensajes de números bloqueados (sin estados
+    de entrega): se responde 200 sin guardarlo.
+    """
+    if not len(numeros_bloqueados):
+        return False  # caso normal: no se parsea dos veces
+    try:
+        mensajes, estados = iterar_webhook_whatsapp(json.loads(payload))
+    except ValueError:
+        return False
+    if estados or not mensajes:
+        return False
+    for msg in mensajes:
+        msg = msg or {}
+        numero = limpiar_numero(msg.get("from") or msg.get("wa_id") or "")
+        if not numero or numero not in numeros_bloqueados:
+            return False
+    log_whatsapp.debug("Webhook descartado: solo números bloqueados", extra={"mensajes": len(mensajes)})
+    return True
+
+
+def iterar_webhook_whatsapp(data):
+    """
+    Recorre un payload (360dialog / Meta Cloud) y devuelve (mensajes, estados)
+    de TODAS las entries/changes, no solo el primero.
+    """
+    mensajes, estados = [], []
+    if not isinstance(data, dict):
+        return mensajes, estados
+
+    # Formato Meta (Graph API): entry -> changes -> value -> messages/statuses
+    for entry in data.get('entry') or []:
+        for change in (entry or {}).get('changes') or []:
+            value = (change or {}).get('value') or {}
+            mensajes.extend(value.get('messages') or [])
+            estados.extend(value.get('statuses') or [])
+
+    # Formato "plano": { "messages": [...], "statuses": [...] }
+    mensajes.extend(data.get('messages') or [])
+    estados.extend(data.get('statuses') or [])
+    return mensajes, estados
+
+
+def procesar_webhook_whatsapp(payload, host_url):
+    """Procesa un webhook guardado (lo llama la cola en segundo plano)."""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        log_whatsapp.warning("Webhook con JSON inválido ignorado", extra={"bytes": len(payload)})
+        return
+
+    # El payload completo solo para una muestra (y con LOG_NIVEL=DEBUG)
+    if log_whatsapp.isEnabledFor(logging.DEBUG) and muestrear():
+        log_whatsapp.debug("Payload de webhook (muestra)", extra={"payload": data})
+
+    mensajes, estados = iterar_webhook_whatsapp(data)
+    log_whatsapp.info("Webhook procesado", extra={"mensajes": len(mensajes), "estados": len(estados)})
+
+    if estados:
+        procesar_estados_whatsapp(estados)
+
+    # Cada mensaje es su propia transacción; si uno falla la excepción sube y
+    # la cola reintenta el payload: los ya procesados se saltan por message_id
+    for msg in mensajes:
+        msg = msg or {}
+        procesar_mensaje_whatsapp(msg, host_url)
+        message_id = (msg.get("id") or "").strip()
         if message_id:
-            ya = WhatsappMensajeProcesado.query.filter_by(message_id=message_id).first()
-            if ya:
-                print(f"ℹ️ Mensaje duplicado ignorado: {message_id}")
-                return "ok", 200
-
-            db.session.add(WhatsappMensajeProcesado(
-                message_id=message_id,
-                numero=numero_completo
-            ))
-            db.session.commit()
-
-
-        # Número del remitente (MSISDN, a veces sin '+')
-        numero_raw = msg.get('from') or msg.get('wa_id') or ""
-        numero_completo = limpiar_numero(numero_raw)
-
-        # Texto del mensaje (puede venir en diferentes campos)
-        texto = ""
-        if isinstance(msg.get('text'), dict):
-            texto = (msg['text'].get('body') or "").strip()
-        elif isinstance(msg.get('button'), dict):
-            texto = (msg['button'].get('text') or "").strip()
-        elif isinstance(msg.get('interactive'), dict):
-            interactive = msg['interactive']
-            if isinstance(interactive.get('button_reply'), dict):
-                texto = (interactive['button_reply'].get('title') or "").strip()
-            elif isinstance(interactive.get('list_reply'), dict):
-                texto = (interactive['list_reply'].get('title') or "").strip()
-
-        texto_lc = texto.lower()
-        print(f"📨 Mensaje recibido de {numero_completo}: '{texto}'")
-
-        # Triggers flexibles (no bloquea si no están; solo loguea)
-        TRIGGERS = ("votar", "enlace", "link", "participar", "quiero votar")
-        if not any(t in texto_lc for t in TRIGGERS):
-            print("ℹ️ Mensaje sin palabra clave; continuaremos si el número está autorizado.")
-
-        # ====== Verificación de bloqueo ======
-        bloqueo = db.session.execute(
-            db.select(BloqueoWhatsapp).where(BloqueoWhatsapp.numero == numero_completo)
-        ).scalar_one_or_none()
-
-        if bloqueo and bloqueo.bloqueado:
-            print(f"🚫 Número bloqueado: {numero_completo}")
-            return "ok", 200
-
-        # ====== Verificación de autorización (debe existir en NumeroTemporal) ======
-        autorizado = NumeroTemporal.query.filter_by(numero=numero_completo).first()
-        if not autorizado:
-            print(f"❌ Número NO autorizado: {numero_completo}")
-
-            # Manejo de advertencias / bloqueo progresivo
-            if not bloqueo:
-                bloqueo = BloqueoWhatsapp(numero=numero_completo, intentos=1)
-                db.session.add(bloqueo)
-            else:
-                bloqueo.intentos += 1
-                if bloqueo.intentos >= 4:
-                    bloqueo.bloqueado = True
-            db.session.commit()
-
-            if bloqueo.intentos < 4:
-                advertencia = (
-                    "⚠️ Para recibir tu enlace de votación, primero debes registrarte en el portal oficial:\n\n"
-                    "👉 https://https://bit.ly/2davueltabk\n\n"
-                    "Asegúrate de ingresar correctamente tu número de WhatsApp durante el registro, "
-                    "ya que solo ese número podrá recibir el enlace.\n\n"
-                    f"Advertencia {bloqueo.intentos}/3"
-                )
-            else:
-                advertencia = (
-                    "🚫 Has excedido el número de intentos permitidos. "
-                    "Tus mensajes ya no serán respondidos por este sistema."
-                )
-
-            # Enviar advertencia (si hay token configurado)
-            try:
-                requests.post(
-                    "https://waba-v2.360dialog.io/messages",
-                    headers={
-                        "Content-Type": "application/json",
-                        "D360-API-KEY": os.environ.get("WABA_TOKEN")
-                    },
-                    json={
-                        "messaging_product": "whatsapp",
-                        "recipient_type": "individual",
-                        "to": numero_completo,
-                        "type": "text",
-                        "text": {"preview_url": False, "body": advertencia}
-                    },
-                    timeout=15
-                )
-            except Exception as e:
-                print("❌ Error enviando advertencia WhatsApp:", str(e))
-
-            return "ok", 200
-
-        # ====== Ya autorizado: recuperar token y enviar enlace ======
-        if not autorizado.token:
-            print(f"⚠️ No se encontró token almacenado para {numero_completo}")
-            return "ok", 200
-
-        # Dominios coherentes
-# ====== Ya autorizado: generar token NUEVO y enviar enlace ======
-        AZURE_DOMAIN = (os.environ.get("AZURE_DOMAIN") or request.host_url.rstrip('/')).rstrip('/')
+            mensajes_procesados.guardar(message_id)  # ya confirmado en la base
 
+    cola_whatsapp.despertar()
 
-        token_data = {
-            "numero": numero_completo,
-            "dominio": AZURE_DOMAIN
-        }
-        token_nuevo = serializer.dumps(token_data)
 
-        # Guardar el token nuevo (reemplaza el viejo)
-        autorizado.token = token_nuevo
-        autorizado.fecha = datetime.utcnow()
-        db.session.commit()
+# Orden de los estados de entrega: un callback atrasado no retrocede el estado
+ESTADOS_ENTREGA = ("sent", "delivered", "read")
+
+
+def procesar_estados_whatsapp(estados):
+    """
+    Callbacks de estado (sent/delivered/read/failed) de los mensajes enviados.
+    Llegan en ráfagas: se agrupan y se aplica un UPDATE por estado.
+    """
+    por_estado = {}
+    for st in estados:
+        wamid = ((st or {}).get("id") or "").strip()
+        estado = ((st or {}).get("status") or "").strip().lower()
+        if wamid and (estado in ESTADOS_ENTREGA or estado == "failed"):
+            por_estado.setdefault(estado, set()).add(wamid)
+
+    M = WhatsappMensajeSaliente
+    for estado, wamids in por_estado.items():
+        consulta = db.update(M).where(M.wamid.in_(wamids))
+        if estado != "failed":
+            anteriores = ESTADOS_ENTREGA[:ESTADOS_ENTREGA.index(estado)]
+            consulta = consulta.where(db.or_(M.estado_entrega.is_(None), M.estado_entrega.in_(anteriores)))
+        db.session.execute(consulta.values(estado_entrega=estado))
+    db.session.commit()
+
+    fallidos = por_estado.get("failed")
+    if fallidos:
+        log_whatsapp.warning("WhatsApp informó mensajes no entregados", extra={"fallidos": len(fallidos)})
 
-        link = f"{AZURE_DOMAIN}/votar?token={token_nuevo}"
-        print(f"🔗 Enlace nuevo generado: {link}")
 
-        print(f"🔗 Enlace recuperado: {link}")
+def procesar_mensaje_whatsapp(msg, host_url):
+    """Un mensaje entrante: advertencia/bloqueo o enlace de votación."""
+    # Número del remitente (MSISDN, a veces sin '+')
+    numero_raw = msg.get("from") or msg.get("wa_id") or ""
+    numero_completo = limpiar_numero(numero_raw)
 
-        mensaje = (
-            "Estás por ejercer un derecho fundamental como ciudadano boliviano.\n\n"
-            "Participa en las *Primarias Bolivia 2025* y elige de manera libre y responsable.\n\n"
-            f"Aquí tienes tu enlace único para votar (válido por 10 minutos):\n{link}\n\n"
-            "Este enlace es personal e intransferible. Solo se permite un voto por persona.\n\n"
-            "Gracias por ser parte del cambio que Bolivia necesita."
+    message_id = (msg.get("id") or "").strip()
+
+    # Cache negativo: los bloqueados no llegan a la base
+    if numero_completo and numero_completo in numeros_bloqueados:
+        log_whatsapp.debug("Mensaje de número bloqueado ignorado sin consultar la base", extra={"numero": numero_completo})
+        return
+
+    # Deduplicación: primero el cache local; la restricción UNIQUE es la
+    # garantía entre workers (INSERT ... ON CONFLICT DO NOTHING, sin SELECT
+    # previo). El registro se confirma junto con la respuesta encolada, así
+    # un fallo a mitad de camino permite reprocesar el mensaje.
+    if message_id:
+        if message_id in mensajes_procesados:
+            log_whatsapp.debug("Mensaje duplicado ignorado", extra={"message_id": message_id})
+            return
+
+        nuevo = insertar_si_no_existe(
+            db.session, WhatsappMensajeProcesado, ["message_id"],
+            message_id=message_id, numero=numero_completo, fecha=datetime.utcnow()
         )
+        if not nuevo:
+            db.session.rollback()
+            mensajes_procesados.guardar(message_id)
+            log_whatsapp.debug("Mensaje duplicado ignorado", extra={"message_id": message_id})
+            return
+
+    # Texto del mensaje (puede venir en diferentes campos)
+    texto = ""
+    if isinstance(msg.get('text'), dict):
+        texto = (msg['text'].get('body') or "").strip()
+    elif isinstance(msg.get('button'), dict):
+        texto = (msg['button'].get('text') or "").strip()
+    elif isinstance(msg.get('interactive'), dict):
+        interactive = msg['interactive']
+        if isinstance(interactive.get('button_reply'), dict):
+            texto = (interactive['button_reply'].get('title') or "").strip()
+        elif isinstance(interactive.get('list_reply'), dict):
+            texto = (interactive['list_reply'].get('title') or "").strip()
+
+    texto_lc = texto.lower()
+    # Triggers flexibles (no bloquea si no están; solo loguea)
+    TRIGGERS = ("votar", "enlace", "link", "participar", "quiero votar")
+    log_whatsapp.info("Mensaje recibido", extra={
+        "numero": numero_completo, "message_id": message_id, "texto": texto[:200],
+        "palabra_clave": any(t in texto_lc for t in TRIGGERS),
+    })
+
+    # ====== Verificación de bloqueo ======
+    bloqueo = db.session.execute(
+        db.select(BloqueoWhatsapp).where(BloqueoWhatsapp.numero == numero_completo)
+    ).scalar_one_or_none()
+
+    if bloqueo and bloqueo.bloqueado:
+        log_whatsapp.info("Número bloqueado", extra={"numero": numero_completo})
+        db.session.commit()
+        numeros_bloqueados.guardar(numero_completo)
+        return
+
+    # ====== Verificación de autorización (debe existir en NumeroTemporal) ======
+    autorizado = NumeroTemporal.query.filter_by(numero=numero_completo).first()
+    if not autorizado:
+        log_whatsapp.info("Número no autorizado", extra={"numero": numero_completo})
 
-        # Enviar mensaje con el enlace
-        try:
-            respuesta = requests.post(
-                "https://waba-v2.360dialog.io/messages",
-                headers={
-                    "Content-Type": "application/json",
-                    "D360-API-KEY": os.environ.get("WABA_TOKEN")
-                },
-                json={
-                    "messaging_product": "whatsapp",
-                    "recipient_type": "individual",
-                    "to": numero_completo,
-                    "type": "text",
-                    "text": {"preview_url": False, "body": mensaje}
-                },
-                timeout=15
+        # Manejo de advertencias / bloqueo progresivo
+        if not bloqueo:
+            bloqueo = BloqueoWhatsapp(numero=numero_completo, intentos=1)
+            db.session.add(bloqueo)
+        else:
+            bloqueo.intentos += 1
+            if bloqueo.intentos >= 4:
+                bloqueo.bloqueado = True
+
+        if bloqueo.intentos < 4:
+            advertencia = (
+                "⚠️ Para recibir tu enlace de votación, primero debes registrarte en el portal oficial:\n\n"
+                "👉 https://https://bit.ly/2davueltabk\n\n"
+                "Asegúrate de ingresar correctamente tu número de WhatsApp durante el registro, "
+                "ya que solo ese número podrá recibir el enlace.\n\n"
+                f"Advertencia {bloqueo.intentos}/3"
+            )
+        else:
+            advertencia = (
+                "🚫 Has excedido el número de intentos permitidos. "
+                "Tus mensajes ya no serán respondidos por este sistema."
             )
-            if 200 <= respuesta.status_code < 300:
-                print("✅ Enlace enviado correctamente.")
-            else:
-                print(f"❌ Error al enviar mensaje WhatsApp: {respuesta.status_code} - {respuesta.text}")
-        except Exception as e:
-            print("❌ Error al enviar WhatsApp:", str(e))
 
-    except Exception as e:
-        print("❌ Error procesando webhook:", str(e))
+        # Enviar advertencia: se encola en la misma transacción que el bloqueo.
+        # Si este worker ya advirtió hace segundos, el intento cuenta igual
+        # pero no se responde otra vez (salvo el aviso de bloqueo).
+        if bloqueo.bloqueado or numero_completo not in numeros_no_autorizados:
+            cola_whatsapp.encolar(numero_completo, advertencia, commit=False)
+        else:
+            log_whatsapp.debug("Advertencia reciente: intento contado sin responder",
+                               extra={"numero": numero_completo, "intentos": bloqueo.intentos})
+        db.session.commit()
+        if bloqueo.bloqueado:
+            numeros_bloqueados.guardar(numero_completo)
+        else:
+            numeros_no_autorizados.guardar(numero_completo)
+        return
 
-    return "ok", 200
+    # ====== Ya autorizado: recuperar token y enviar enlace ======
+    if not autorizado.token:
+        log_whatsapp.warning("Número autorizado sin token almacenado", extra={"numero": numero_completo})
+        db.session.commit()
+        return
+
+    # ====== Ya autorizado: generar token NUEVO y enviar enlace ======
+    AZURE_DOMAIN = (os.environ.get("AZURE_DOMAIN") or host_url.rstrip('/')).rstrip('/')
+
+    token_data = {
+        "numero": numero_completo,
+        "dominio": AZURE_DOMAIN
+    }
+    token_nuevo = serializer.dumps(token_data)
+
+    # Guardar el token nuevo (reemplaza el viejo); se confirma junto con el mensaje encolado
+    autorizado.token = token_nuevo
+    autorizado.fecha = datetime.utcnow()
+
+    link = f"{AZURE_DOMAIN}/votar?token={token_nuevo}"
+
+    mensaje = (
+        "Estás por ejercer un derecho fundamental como ciudadano boliviano.\n\n"
+        "Participa en las *Primarias Bolivia 2025* y elige de manera libre y responsable.\n\n"
+        f"Aquí tienes tu enlace único para votar (válido por 10 minutos):\n{link}\n\n"
+        "Este enlace es personal e intransferible. Solo se permite un voto por persona.\n\n"
+        "Gracias por ser parte del cambio que Bolivia necesita."
+    )
+
+    # Enviar mensaje con el enlace (se encola; la entrega es en segundo plano)
+    cola_whatsapp.encolar(numero_completo, mensaje, commit=False)
+    db.session.commit()
+    # Sin el enlace: el token permite votar
+    log_whatsapp.info("Enlace encolado para envío", extra={"numero": numero_completo})
+
+
+# ---------------------------
+# Resultados (conteos incrementales; ver conteo_votos.py)
+# ---------------------------
+def resultados_autorizados():
+    # Públicos solo si se habilita explícitamente; si no, requieren X-Admin-Key
+    return os.environ.get("RESULTADOS_PUBLICOS", "0") == "1" or admin_autorizado()
+
+
+@app.route("/api/resultados")
+@app.route("/api/resultados/<dimension>")
+def api_resultados(dimension="candidato"):
+    if not resultados_autorizados():
+        return "Acceso no autorizado", 403
+    if dimension not in NOMBRES_DIMENSIONES:
+        return jsonify({"error": "dimensión inválida", "dimensiones": NOMBRES_DIMENSIONES}), 404
+    cache_control = "public, max-age=2" if os.environ.get("RESULTADOS_PUBLICOS", "0") == "1" else "private, no-cache"
+    return respuesta_json(escrutinio.resultados(dimension), cache_control=cache_control)
+
+
+# ---------------------------
+# Exportación de votos para auditoría (ver exportar_votos.py)
+# ---------------------------
+def consulta_exportacion(desde, hasta, departamento):
+    return exportar_votos.consulta_votos(
+        Voto,
+        desde=exportar_votos.parsear_fecha(desde),
+        hasta=exportar_votos.parsear_fecha(hasta, fin_de_dia=True),
+        departamento=(departamento or "").strip() or None,
+    )
+
+
+@app.route("/admin/exportar_votos", methods=["GET"])
+def admin_exportar_votos():
+    # ?formato=csv|parquet&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&departamento=...
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    formato = request.args.get("formato", "csv")
+    try:
+        if formato not in exportar_votos.FORMATOS:
+            raise exportar_votos.ErrorExportacion(f"Formato inválido: {formato!r}")
+        if formato == "parquet" and exportar_votos.pq is None:
+            raise exportar_votos.ErrorExportacion("Exportar a Parquet requiere pyarrow")
+        consulta, columnas = consulta_exportacion(
+            request.args.get("desde"), request.args.get("hasta"), request.args.get("departamento")
+        )
+    except exportar_votos.ErrorExportacion as e:
+        return jsonify({"error": str(e)}), 400
+
+    nombre = f"votos_{datetime.utcnow():%Y%m%d_%H%M%S}." + ("csv.gz" if formato == "csv" else "parquet")
+    cuerpo = exportar_votos.generar(formato, db.session, consulta, columnas)
+    return Response(
+        stream_with_context(cuerpo),
+        mimetype="application/gzip" if formato == "csv" else "application/vnd.apache.parquet",
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@app.cli.command("exportar-votos")
+@click.option("--formato", type=click.Choice(exportar_votos.FORMATOS), default="csv")
+@click.option("--salida", required=True, help="Archivo de salida (p. ej. votos.csv.gz)")
+@click.option("--desde", help="Fecha inicial YYYY-MM-DD (inclusive)")
+@click.option("--hasta", help="Fecha final YYYY-MM-DD (inclusive)")
+@click.option("--departamento")
+def exportar_votos_cmd(formato, salida, desde, hasta, departamento):
+    """Exporta los votos a CSV gzip o Parquet sin cargarlos en memoria."""
+    try:
+        consulta, columnas = consulta_exportacion(desde, hasta, departamento)
+        escritos = exportar_votos.exportar_a_archivo(formato, db.session, consulta, columnas, salida)
+    except exportar_votos.ErrorExportacion as e:
+        raise click.ClickException(str(e))
+    print(f"📦 Exportación escrita en {salida} ({escritos} bytes)")
+
+
+@app.cli.command("recontar-votos")
+def recontar_votos_cmd():
+    """Reconstruye conteo_votos desde la tabla votos."""
+    print(f"🗳️ Recontados {escrutinio.recontar()} votos")
+
+
+# ---------------------------
+# Retención de tablas de WhatsApp
+# ---------------------------
+def purgar_whatsapp(dias_dedup=None, dias_webhooks=None, lote=1000):
+    """
+    Borra por lotes los message_id viejos (WhatsApp deja de reintentar mucho
+    antes) y los webhooks ya procesados. Devuelve cuántas filas borró de cada tabla.
+    """
+    dias_dedup = dias_dedup if dias_dedup is not None else float(os.environ.get("WHATSAPP_DEDUP_RETENCION_DIAS", "7"))
+    dias_webhooks = dias_webhooks if dias_webhooks is not None else float(os.environ.get("WEBHOOK_RETENCION_DIAS", "2"))
+
+    limite = datetime.utcnow() - timedelta(days=dias_dedup)
+    borrados = {
+        "mensajes_procesados": borrar_en_lotes(
+            db.session, WhatsappMensajeProcesado, WhatsappMensajeProcesado.fecha < limite, lote
+        ),
+        "webhooks": cola_webhooks.purgar(timedelta(days=dias_webhooks), lote),
+    }
+    if any(borrados.values()):
+        log.info("Retención WhatsApp", extra={"borrados": borrados})
+    return borrados
+
+
+@app.cli.command("purgar-whatsapp")
+def purgar_whatsapp_cmd():
+    """Retención de whatsapp_mensajes_procesados y whatsapp_webhooks_recibidos."""
+    borrados = tarea_retencion_whatsapp.ejecutar()
+    for tabla, filas in borrados.items():
+        click.echo(f"🧹 {tabla}: {filas} filas borradas")
+
+
+# ---------------------------
+# Barrido de números temporales vencidos
+# ---------------------------
+def barrer_numeros_temporales(lote=None):
+    """
+    Borra por lotes los NumeroTemporal cuyo token venció hace rato. Se deja
+    un margen (NUMEROS_TEMPORALES_GRACIA_SEGUNDOS) porque la fila también
+    autoriza al webhook a reenviar un enlace nuevo: sin margen, quien escribe
+    por WhatsApp unos minutos tarde recibiría advertencias de bloqueo.
+    """
+    gracia = float(os.environ.get("NUMEROS_TEMPORALES_GRACIA_SEGUNDOS", "3600"))
+    lote = lote or int(os.environ.get("NUMEROS_TEMPORALES_LOTE", "500"))
+    limite = datetime.utcnow() - timedelta(seconds=TOKEN_VIDA_SEGUNDOS + gracia)
+    borrados = borrar_en_lotes(db.session, NumeroTemporal, NumeroTemporal.fecha < limite, lote)
+    if borrados:
+        log.info("Números temporales vencidos borrados", extra={"borrados": borrados})
+    return {"borrados": borrados}
+
+
+def purgar_limites_tasa():
+    # Cubetas sin uso (ya estarían llenas); solo aplica al backend en la base
+    if isinstance(limitador, LimitadorDB):
+        return {"borrados": limitador.purgar(3600)}
+    return {"borrados": 0}
+
+
+# ---------------------------
+# Tareas periódicas en proceso (ver tareas.py); intervalo 0 = desactivada
+# ---------------------------
+def cargar_numeros_bloqueados():
+    """Precarga el cache negativo con los números bloqueados en la base."""
+    numeros = db.session.execute(
+        db.select(BloqueoWhatsapp.numero)
+        .where(BloqueoWhatsapp.bloqueado.is_(True))
+        .order_by(BloqueoWhatsapp.id.desc())
+        .limit(numeros_bloqueados.max_claves)
+    ).scalars().all()
+    for numero in numeros:
+        numeros_bloqueados.guardar(numero)
+    return {"cargados": len(numeros)}
+
+
+tarea_numeros_temporales = TareaPeriodica(
+    app, "numeros_temporales",
+    float(os.environ.get("BARRIDO_NUMEROS_TEMPORALES_SEGUNDOS", "300")),
+    barrer_numeros_temporales,
+)
+tarea_retencion_whatsapp = TareaPeriodica(
+    app, "retencion_whatsapp",
+    float(os.environ.get("RETENCION_WHATSAPP_SEGUNDOS", "3600")),
+    purgar_whatsapp,
+)
+tarea_limites_tasa = TareaPeriodica(
+    app, "limites_tasa",
+    float(os.environ.get("PURGA_LIMITES_TASA_SEGUNDOS", "3600")),
+    purgar_limites_tasa,
+)
+tarea_bloqueados_whatsapp = TareaPeriodica(
+    app, "bloqueados_whatsapp",
+    float(os.environ.get("WHATSAPP_BLOQUEADOS_CARGA_SEGUNDOS", "300")),
+    cargar_numeros_bloqueados,
+)
+tarea_metricas = TareaPeriodica(
+    app, "metricas",
+    float(os.environ.get("METRICAS_VOLCADO_SEGUNDOS", "10")),
+    lambda: {"series": sum(len(m["series"]) for m in metricas.volcar().values())},
+)
+TAREAS = (tarea_numeros_temporales, tarea_retencion_whatsapp, tarea_limites_tasa, tarea_bloqueados_whatsapp,
+          tarea_metricas)
+
+
+@app.cli.command("barrer-numeros-temporales")
+def barrer_numeros_temporales_cmd():
+    """Borra los números temporales vencidos (una vez) y muestra las métricas."""
+    tarea_numeros_temporales.ejecutar()
+    print(json.dumps(tarea_numeros_temporales.estadisticas(), ensure_ascii=False))
 
 
 # ---------------------------
@@ -512,7 +1001,9 @@ def generar_link():
 
         numero_completo = limpiar_numero(pais + numero)
 
-
+        limitado = limitar_numero("generar_link", numero_completo)
+        if limitado:
+            return limitado
 
         # Si ya votó, mostrar mensaje
         if Voto.query.filter_by(numero=numero_completo).first():
@@ -542,6 +1033,7 @@ def generar_link():
             temporal.fecha = datetime.utcnow()
 
         db.session.commit()
+        invalidar_cache_numero(numero_completo)
 
 
         # Redireccionar al WhatsApp con el mensaje prellenado
@@ -563,11 +1055,26 @@ def votar():
 
     try:
   
-        data = serializer.loads(token, max_age=600)  
+        data = serializer.loads(token, max_age=TOKEN_VIDA_SEGUNDOS)  
         numero = limpiar_numero(data.get("numero"))
-        registro = NumeroTemporal.query.filter_by(numero=numero, token=token).first()
-        if not registro:
-            enviar_mensaje_whatsapp(numero, "Este enlace ya fue utilizado o es inválido. Solicita uno nuevo.")
+
+        limitado = limitar_numero("votar", numero)
+        if limitado:
+            return limitado
+
+        # Una sola consulta: token vigente del número y si ya votó
+        token_actual, ya_voto = db.session.execute(
+            db.select(
+                db.select(NumeroTemporal.token)
+                .where(NumeroTemporal.numero == numero)
+                .scalar_subquery(),
+                db.select(Voto.id).where(Voto.numero == numero).exists(),
+            )
+        ).one()
+
+        if token_actual != token:
+            # El aviso se encola: la respuesta no espera a 360dialog
+            cola_whatsapp.encolar(numero, "Este enlace ya fue utilizado o es inválido. Solicita uno nuevo.")
             return "Este enlace ya fue utilizado, es inválido o ha intentado manipular el proceso."
 
 
@@ -587,13 +1094,8 @@ def votar():
     except BadSignature:
         return "Enlace inválido o alterado."
 
-    # Verificar que el número esté en NumeroTemporal (aún válido)
-    if not NumeroTemporal.query.filter_by(numero=numero).first():
-        enviar_mensaje_whatsapp(numero, "Detectamos que intentó ingresar datos falsos. Por favor, use su número real o será bloqueado.")
-        return "Este enlace ya fue utilizado, es inválido o ha intentado manipular el proceso."
-
     # Verificar si ya votó
-    if Voto.query.filter_by(numero=numero).first():
+    if ya_voto:
         return render_template("voto_ya_registrado.html")
 
     # Guardar el número del token validado en sesión para comparación posterior segura
@@ -628,6 +1130,10 @@ def enviar_voto():
     if not numero:
         return "Acceso denegado: sin sesión válida o token expirado.", 403
 
+    limitado = limitar_numero("enviar_voto", numero)
+    if limitado:
+        return limitado
+
     # Campos requeridos
     genero = request.form.get('genero')
     pais = request.form.get('pais')
@@ -646,7 +1152,7 @@ def enviar_voto():
     
     latitud = request.form.get('latitud')
     longitud = request.form.get('longitud')
-    ip = request.headers.get('X-Forwarded-For', request.remote_addr).split(',')[0].strip()
+    ip = ip_cliente(request)  # la misma que usa el límite por IP (salto confiable de X-Forwarded-For)
 
 
 
@@ -665,10 +1171,11 @@ def enviar_voto():
 
 
 
-    if Voto.query.filter_by(numero=numero).first():
-        return render_template("voto_ya_registrado.html")
-
-    nuevo_voto = Voto(
+    # Un solo viaje: INSERT ... ON CONFLICT (numero) DO NOTHING RETURNING id,
+    # el DELETE del número temporal y la suma a los conteos, en la misma
+    # transacción. Un doble envío simultáneo choca con el UNIQUE y cae en
+    # "ya registrado", no en un 500.
+    valores_voto = dict(
         numero=numero,
         genero=genero,
         pais=pais,
@@ -685,12 +1192,21 @@ def enviar_voto():
         latitud=float(latitud) if latitud else None,
         longitud=float(longitud) if longitud else None,
         ip=ip,
-        candidato=candidato
-        
+        candidato=candidato,
+        fecha=datetime.utcnow()
+    )
+    voto_id = insertar_si_no_existe_y_luego(
+        db.session, Voto, ["numero"], valores_voto,
+        [
+            lambda insertado: db.delete(NumeroTemporal).where(NumeroTemporal.numero == numero, insertado),
+            lambda insertado: escrutinio.sumar_voto(valores_voto, insertado),
+        ]
     )
+    if voto_id is None:
+        db.session.rollback()
+        session.pop('numero_token', None)
+        return render_template("voto_ya_registrado.html")
 
-    db.session.add(nuevo_voto)
-    NumeroTemporal.query.filter_by(numero=numero).delete()
     db.session.commit()
     session.pop('numero_token', None)
 
@@ -714,9 +1230,8 @@ def enviar_voto():
 # ---------------------------
 # API local desde CSV con validación de origen (Referer)
 # ---------------------------
-@app.route('/api/recintos')
-def api_recintos():
-    # Validación del dominio de origen (protección básica)
+def referer_api_valido():
+    """Validación del dominio de origen (protección básica)."""
     referer = request.headers.get("Referer", "")
     dominio_esperado = os.environ.get(
         "AZURE_DOMAIN",
@@ -724,130 +1239,83 @@ def api_recintos():
     )
 
     # OJO: a veces el Referer viene vacío por privacidad del navegador.
-    # Si te da 403, más abajo te digo cómo ajustarlo.
-    if referer and (dominio_esperado not in referer):
+    return not referer or (dominio_esperado in referer)
+
+
+@app.route('/api/recintos')
+def api_recintos():
+    if not referer_api_valido():
         return "Acceso no autorizado", 403
 
+    # Índice en memoria: el CSV se lee al iniciar y solo se relee si cambia su mtime
+    recintos = RECINTOS.obtener()
+    if recintos is None:
+        log_api.error("Recintos no disponibles", extra={"error": RECINTOS.error})
+        return "Archivo de recintos no disponible.", 500
 
-    archivo = os.path.join(os.path.dirname(__file__), "privado", "RecintosParaPrimaria.csv")
-    datos = []
+    return respuesta_json(recintos.cuerpo, version=RECINTOS.version)
 
-    try:
-        with open(archivo, encoding="utf-8-sig") as f:
-            lector = csv.DictReader(f)
-
-            required = {
-                "id_pais", "nombre_pais",
-                "id_departamento", "nombre_departamento",
-                "id_provincia", "nombre_provincia",
-                "id_municipio", "nombre_municipio",
-                "id_recinto", "nombre_recinto",
-            }
-            headers = set(lector.fieldnames or [])
-            faltantes = required - headers
-            if faltantes:
-                print("Faltan columnas en RecintosParaPrimaria.csv:", faltantes)
-                return "CSV de recintos con columnas incompletas.", 500
-
-            for fila in lector:
-                datos.append({
-                    "id_pais": str(fila.get("id_pais") or "").strip(),
-                    "nombre_pais": (fila.get("nombre_pais") or "").strip(),
-
-                    "id_departamento": str(fila.get("id_departamento") or "").strip(),
-                    "nombre_departamento": (fila.get("nombre_departamento") or "").strip(),
-
-                    "id_provincia": str(fila.get("id_provincia") or "").strip(),
-                    "nombre_provincia": (fila.get("nombre_provincia") or "").strip(),
-
-                    # CLAVE PARA EL PASO 3/4:
-                    "id_municipio": str(fila.get("id_municipio") or "").strip(),
-                    "nombre_municipio": (fila.get("nombre_municipio") or "").strip(),
-
-                    "id_recinto": str(fila.get("id_recinto") or "").strip(),
-                    "nombre_recinto": (fila.get("nombre_recinto") or "").strip(),
-
-                    # extras opcionales (si existen)
-                    "direccion": (fila.get("Direccion") or "").strip(),
-                    "latitud": (fila.get("latitud") or "").strip(),
-                    "longitud": (fila.get("longitud") or "").strip(),
-                })
-
-        return jsonify(datos)
-
-    except FileNotFoundError:
-        print("Archivo RecintosParaPrimaria.csv no encontrado en privado/.")
+
+@app.route('/api/recintos/<nivel>')
+def api_recintos_nivel(nivel):
+    """
+    Carga perezosa de los selects: devuelve solo los hijos del nodo elegido.
+      /api/recintos/paises
+      /api/recintos/departamentos?id_pais=32
+      /api/recintos/provincias?id_pais=32&id_departamento=1
+      /api/recintos/municipios?id_pais=32&id_departamento=1&id_provincia=1
+      /api/recintos/recintos?id_pais=32&id_departamento=1&id_provincia=1&id_municipio=1
+    """
+    if nivel not in RECINTOS_NIVELES:
+        return "Nivel no válido.", 404
+
+    if not referer_api_valido():
+        return "Acceso no autorizado", 403
+
+    recintos = RECINTOS.obtener()
+    if recintos is None:
+        log_api.error("Recintos no disponibles", extra={"error": RECINTOS.error})
         return "Archivo de recintos no disponible.", 500
-    except Exception as e:
-        print(f"Error al leer CSV recintos: {str(e)}")
-        return "Error procesando los datos.", 500
+
+    params = RECINTOS_PARAMS[:RECINTOS_NIVELES.index(nivel)]
+    ids = tuple((request.args.get(p) or "").strip() for p in params)
+    if not all(ids):
+        return jsonify([])
+
+    cuerpo = recintos.hijos(nivel, ids)
+    if cuerpo is None:
+        return jsonify([])
+
+    return respuesta_json(cuerpo, version=RECINTOS.version)
 
 
 @app.route("/api/candidatos")
 def api_candidatos():
-    # Recibimos textos desde el frontend
+    # Recibimos textos desde el frontend (o directamente el id_municipio del CSV de candidatos)
+    id_municipio = (request.args.get("id_municipio") or "").strip()
     departamento = request.args.get("departamento", "")
     provincia = request.args.get("provincia", "")
     municipio = request.args.get("municipio", "")
 
-    if not (departamento and provincia and municipio):
-        print("❌ Faltan parámetros departamento/provincia/municipio")
+    if not id_municipio and not (departamento and provincia and municipio):
+        log_api.debug("Faltan parámetros departamento/provincia/municipio")
         return jsonify([])
 
-    dep_norm = norm(departamento)
-    prov_norm = norm(provincia)
-    mun_norm = norm(municipio)
-
-    archivo_candidatos = os.path.join(
-        os.path.dirname(__file__),
-        "privado",
-        "CandidatosPorMunicipio.csv"
-    )
-
-    candidatos = []
-    vistos = set()  # para evitar duplicados exactos
+    candidatos = CANDIDATOS.obtener()
+    if candidatos is None:
+        log_api.error("Candidatos no disponibles", extra={"error": CANDIDATOS.error})
+        return jsonify([])
 
-    try:
-        with open(archivo_candidatos, encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-
-            for fila in reader:
-                dep2 = norm(fila.get("departamento"))
-                prov2 = norm(fila.get("provincia"))
-                mun2 = norm(fila.get("municipio"))
-                cargo2 = norm(fila.get("cargo"))
-
-                if (
-                    dep2 == dep_norm and
-                    prov2 == prov_norm and
-                    mun2 == mun_norm and
-                    ("alcalde" in cargo2)
-                ):
-                    nombre = (fila.get("nombre_completo") or "").strip()
-                    org = (fila.get("organizacion_politica") or "").strip()
-                    if not nombre:
-                        continue
-
-                    key = (nombre, org)
-                    if key in vistos:
-                        continue
-                    vistos.add(key)
-
-                    candidatos.append({
-                        "id_nombre_completo": (fila.get("id_nombre_completo") or "").strip() or nombre,
-                        "nombre_completo": nombre,
-                        "organizacion_politica": org,
-                        "id_organizacion_politica": (fila.get("id_organizacion_politica") or "").strip(),
-                        "id_cargo": (fila.get("id_cargo") or "").strip(),
-                        "cargo": (fila.get("cargo") or "").strip()
-                    })
+    # Búsqueda O(1) en el índice armado al iniciar (sin leer el CSV por request)
+    if id_municipio:
+        cuerpo = candidatos.alcaldes_de_id(id_municipio)
+    else:
+        cuerpo = candidatos.alcaldes(departamento, provincia, municipio)
 
-    except Exception as e:
-        print("❌ Error leyendo CandidatosPorMunicipio.csv:", str(e))
+    if cuerpo is None:
         return jsonify([])
 
-    print(f"✅ Candidatos encontrados para {dep_norm} / {prov_norm} / {mun_norm}: {len(candidatos)}")
-    return jsonify(candidatos)
+    return respuesta_json(cuerpo, version=CANDIDATOS.version)
 
 
 
@@ -856,66 +1324,108 @@ def api_gobernadores():
     # 1) Recibimos el departamento desde el navegador
     departamento = request.args.get("departamento", "")
     if not departamento:
-        print("❌ Falta parámetro departamento")
+        log_api.debug("Falta parámetro departamento")
         return jsonify([])
 
-    dep_norm = norm(departamento)
-
-    # 2) Ruta del CSV
-    archivo_gob = os.path.join(
-        os.path.dirname(__file__),
-        "privado",
-        "gobernaciones_por_departamento.csv"
-    )
+    # 2) Índice armado al iniciar (se recarga si cambia el CSV)
+    gobernadores = GOBERNADORES.obtener()
+    if gobernadores is None:
+        log_api.error("Gobernadores no disponibles", extra={"error": GOBERNADORES.error})
+        return jsonify([])
 
-    # 3) Si el archivo no existe, devolvemos vacío
-    if not os.path.exists(archivo_gob):
-        print("❌ No existe el archivo:", archivo_gob)
+    # 3) Respuesta ya serializada por departamento
+    cuerpo = gobernadores.de(departamento)
+    if cuerpo is None:
         return jsonify([])
 
-    gobernadores = []
-    vistos = set()  # evita duplicados
+    return respuesta_json(cuerpo, version=GOBERNADORES.version)
 
-    try:
-        with open(archivo_gob, encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-
-            # 4) Validar columnas mínimas del CSV
-            required = {"departamento", "cargo", "nombre_completo", "organizacion_politica"}
-            headers = set(reader.fieldnames or [])
-            faltantes = required - headers
-            if faltantes:
-                print("❌ Faltan columnas en gobernaciones_por_departamento.csv:", faltantes)
-                print("📌 Columnas detectadas:", reader.fieldnames)
-                return jsonify([])
-
-            # 5) Leer filas y filtrar por departamento + cargo gobernador
-            for fila in reader:
-                dep2 = norm(fila.get("departamento"))
-                cargo2 = norm(fila.get("cargo"))
-
-                if dep2 == dep_norm and ("gobernador" in cargo2):
-                    nombre = (fila.get("nombre_completo") or "").strip()
-                    org = (fila.get("organizacion_politica") or "").strip()
-                    if not nombre:
-                        continue
-
-                    key = (nombre, org)
-                    if key in vistos:
-                        continue
-                    vistos.add(key)
-
-                    gobernadores.append({
-                        "nombre_completo": nombre,
-                        "organizacion_politica": org
-                    })
 
-    except Exception as e:
-        print("❌ Error leyendo gobernaciones_por_departamento.csv:", str(e))
-        return jsonify([])
+# ---------------------------
+# Admin: estado y recarga de datos de referencia
+# ---------------------------
+def admin_autorizado():
+    clave = os.environ.get("ADMIN_KEY")
+    return bool(clave) and request.headers.get("X-Admin-Key") == clave
+
+
+def metricas_autorizadas():
+    # Prometheus: Authorization: Bearer <METRICAS_TOKEN>; a mano, X-Admin-Key
+    token = os.environ.get("METRICAS_TOKEN")
+    if token and request.headers.get("Authorization") == f"Bearer {token}":
+        return True
+    return admin_autorizado()
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if not metricas_autorizadas():
+        return "Acceso no autorizado", 403
+    return Response(metricas.exponer(), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
-    print(f"✅ Gobernadores encontrados para {dep_norm}: {len(gobernadores)}")
-    return jsonify(gobernadores)
+
+@app.route("/admin/datos", methods=["GET"])
+def admin_datos():
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    return jsonify({"version": REGISTRO.version(), "datasets": REGISTRO.estado()})
+
+
+@app.route("/admin/whatsapp", methods=["GET"])
+def admin_whatsapp():
+    # Latencias del cliente 360dialog (de este worker) y estado de las colas
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    entregas = dict(db.session.execute(
+        db.select(WhatsappMensajeSaliente.estado_entrega, db.func.count(WhatsappMensajeSaliente.id))
+        .where(WhatsappMensajeSaliente.estado_entrega.is_not(None))
+        .group_by(WhatsappMensajeSaliente.estado_entrega)
+    ).all())
+    return jsonify({
+        "cliente": cliente_whatsapp.estadisticas(),
+        "cola": cola_whatsapp.contar_por_estado(),
+        "entregas": entregas,
+        "webhooks": cola_webhooks.contar_por_estado(),
+        "dedup_cache": mensajes_procesados.estadisticas(),
+        "bloqueados_cache": numeros_bloqueados.estadisticas(),
+        "no_autorizados_cache": numeros_no_autorizados.estadisticas(),
+    })
+
+
+@app.route("/admin/db", methods=["GET"])
+def admin_db():
+    # Estado del pool de conexiones de este worker (para dimensionar workers)
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    return jsonify(estadisticas_pool(db.engine))
+
+
+@app.route("/admin/limites", methods=["GET"])
+def admin_limites():
+    # Reglas vigentes y rechazos de este worker
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    return jsonify(limite_http.estadisticas())
+
+
+@app.route("/admin/tareas", methods=["GET"])
+def admin_tareas():
+    # Métricas de las limpiezas periódicas de este worker
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    return jsonify({t.nombre: t.estadisticas() for t in TAREAS})
+
+
+@app.route("/admin/recargar_datos", methods=["POST"])
+@csrf.exempt
+def admin_recargar_datos():
+    # Recarga en ESTE worker; los demás la detectan por mtime si el CSV cambió
+    if not admin_autorizado():
+        return "Acceso no autorizado", 403
+    resultado = REGISTRO.recargar()
+    log.info("Datos de referencia recargados", extra={"recargados": resultado, "version_datos": REGISTRO.version()})
+    return jsonify({"ok": all(resultado.values()), "recargados": resultado,
+                    "version": REGISTRO.version(), "datasets": REGISTRO.estado()})
 
 
 # ---------------------------
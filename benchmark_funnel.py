@@ -0,0 +1,379 @@
+# ---------------------------
+# Prueba de carga del embudo completo de votación
+# ---------------------------
+"""
+Usuarios virtuales concurrentes recorren el embudo real por HTTP:
+
+  generar_link -> webhook de WhatsApp -> enlace recibido -> /votar ->
+  /api/recintos/<nivel> + /api/candidatos + /api/gobernadores -> enviar_voto
+
+Levanta la app contra SQLite o un Postgres local en un servidor HTTP con
+hilos, y un servidor falso de 360dialog que responde con un wamid y guarda
+cada mensaje: el usuario espera ahí su enlace, como en WhatsApp
+("whatsapp_enlace" mide desde el POST del webhook hasta que el enlace sale
+de la cola). Reporta latencia p50/p95/p99 y throughput por endpoint como
+JSON (con el commit), para comparar entre commits:
+
+    python benchmark_funnel.py --usuarios 300 --concurrencia 20 --salida bench/antes.json
+    python benchmark_funnel.py --url postgresql://.../bench --comparar bench/antes.json
+
+Los límites por IP/número (limite_http.py) se desactivan salvo
+--con-limites. Los logs de la app van a stderr; el resultado, a stdout.
+¡Borra y recrea las tablas de la base indicada! Usar una base descartable.
+"""
+import argparse
+import contextlib
+import http.server
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+RE_CSRF = re.compile(r'name="csrf_token" value="([^"]+)"')
+RE_ENLACE = re.compile(r"(/votar\?token=\S+)")
+CODIGO_PAIS = "591"
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ---------------------------
+# 360dialog falso
+# ---------------------------
+class Buzon:
+    """Mensajes "entregados" por número; los usuarios virtuales esperan aquí su enlace."""
+
+    def __init__(self):
+        self._mensajes = {}
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self.total = 0
+
+    def recibir(self, numero, texto):
+        with self._cond:
+            self._mensajes.setdefault(numero, []).append(texto)
+            self.total += 1
+            self._cond.notify_all()
+            return f"wamid.bench.{next(self._ids)}"
+
+    def esperar(self, numero, patron, timeout):
+        """Primer match de `patron` en los mensajes de `numero` (o None al vencer)."""
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for texto in self._mensajes.get(numero, ()):
+                    encontrado = patron.search(texto)
+                    if encontrado:
+                        return encontrado.group(1)
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._cond.wait(restante)
+
+
+def servidor_360dialog(buzon, puerto):
+    class Manejador(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            wamid = buzon.recibir(cuerpo["to"], cuerpo["text"]["body"])
+            respuesta = json.dumps({"messages": [{"id": wamid}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(respuesta)))
+            self.end_headers()
+            self.wfile.write(respuesta)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = http.server.ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# ---------------------------
+# Mediciones
+# ---------------------------
+def percentil(ordenados, p):
+    """Percentil por rango más cercano sobre una lista ordenada."""
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return round(ordenados[indice], 2)
+
+
+class Medidor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tiempos = {}
+        self.errores = {}
+
+    def registrar(self, nombre, ms, ok=True):
+        with self._lock:
+            self.tiempos.setdefault(nombre, []).append(ms)
+            if not ok:
+                self.errores[nombre] = self.errores.get(nombre, 0) + 1
+
+    def resumen(self, duracion):
+        resumen = {}
+        for nombre, tiempos in sorted(self.tiempos.items()):
+            ordenados = sorted(tiempos)
+            resumen[nombre] = {
+                "n": len(ordenados),
+                "errores": self.errores.get(nombre, 0),
+                "p50_ms": percentil(ordenados, 50),
+                "p95_ms": percentil(ordenados, 95),
+                "p99_ms": percentil(ordenados, 99),
+                "media_ms": round(sum(ordenados) / len(ordenados), 2),
+                "max_ms": round(ordenados[-1], 2),
+                "por_seg": round(len(ordenados) / duracion, 1) if duracion else None,
+            }
+        return resumen
+
+
+class ErrorEmbudo(Exception):
+    pass
+
+
+# ---------------------------
+# Usuario virtual
+# ---------------------------
+class Usuario:
+    def __init__(self, i, base, buzon, medidor, rnd, timeout_enlace):
+        self.numero_local = f"7{i:07d}"
+        self.numero = CODIGO_PAIS + self.numero_local
+        self.i = i
+        self.base = base
+        self.buzon = buzon
+        self.medidor = medidor
+        self.rnd = rnd
+        self.timeout_enlace = timeout_enlace
+        self.http = requests.Session()
+
+    def pedir(self, nombre, metodo, ruta, esperado=200, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resp = self.http.request(metodo, self.base + ruta, timeout=30, allow_redirects=False, **kwargs)
+        except requests.RequestException as e:
+            self.medidor.registrar(nombre, (time.perf_counter() - inicio) * 1000, ok=False)
+            raise ErrorEmbudo(f"{nombre}: {e}")
+        ok = resp.status_code == esperado
+        self.medidor.registrar(nombre, (time.perf_counter() - inicio) * 1000, ok=ok)
+        if not ok:
+            raise ErrorEmbudo(f"{nombre}: HTTP {resp.status_code}")
+        return resp
+
+    def api(self, ruta, referer, **params):
+        nombre = ruta.split("?")[0]
+        return self.pedir(nombre, "GET", ruta, params=params, headers={"Referer": referer}).json()
+
+    def elegir(self, opciones, que):
+        if not opciones:
+            raise ErrorEmbudo(f"sin opciones de {que}")
+        return self.rnd.choice(opciones)
+
+    def recorrer(self):
+        # 1) Registro del número
+        pagina = self.pedir("/generar_link [GET]", "GET", "/generar_link").text
+        self.pedir("/generar_link [POST]", "POST", "/generar_link", esperado=302, data={
+            "pais": CODIGO_PAIS, "numero": self.numero_local, "csrf_token": RE_CSRF.search(pagina).group(1),
+        })
+
+        # 2) Mensaje entrante por WhatsApp y espera del enlace
+        inicio = time.perf_counter()
+        self.pedir("/whatsapp", "POST", "/whatsapp", json={"messages": [{
+            "id": f"wamid.in.{self.i}.{self.rnd.getrandbits(32)}",
+            "from": self.numero,
+            "text": {"body": "Quiero votar"},
+        }]})
+        enlace = self.buzon.esperar(self.numero, RE_ENLACE, self.timeout_enlace)
+        self.medidor.registrar("whatsapp_enlace", (time.perf_counter() - inicio) * 1000, ok=bool(enlace))
+        if not enlace:
+            raise ErrorEmbudo("whatsapp_enlace: no llegó el enlace")
+
+        # 3) Página de votación
+        pagina = self.pedir("/votar", "GET", enlace).text
+        referer = self.base + enlace
+
+        # 4) Selects en cascada (como el JS de votar.html)
+        paises = self.api("/api/recintos/paises", referer)
+        pais = next((p for p in paises if p["nombre_pais"] == "Bolivia"), None) or self.elegir(paises, "país")
+        id_pais = pais["id_pais"]
+        dep = self.elegir(self.api("/api/recintos/departamentos", referer, id_pais=id_pais), "departamento")
+        prov = self.elegir(self.api("/api/recintos/provincias", referer, id_pais=id_pais,
+                                    id_departamento=dep["id_departamento"]), "provincia")
+        mun = self.elegir(self.api("/api/recintos/municipios", referer, id_pais=id_pais,
+                                   id_departamento=dep["id_departamento"],
+                                   id_provincia=prov["id_provincia"]), "municipio")
+        recinto = self.elegir(self.api("/api/recintos/recintos", referer, id_pais=id_pais,
+                                       id_departamento=dep["id_departamento"],
+                                       id_provincia=prov["id_provincia"],
+                                       id_municipio=mun["id_municipio"]), "recinto")
+        candidatos = self.api("/api/candidatos", referer, departamento=dep["nombre_departamento"],
+                              provincia=prov["nombre_provincia"], municipio=mun["nombre_municipio"])
+        gobernadores = self.api("/api/gobernadores", referer, departamento=dep["nombre_departamento"])
+
+        # 5) Voto
+        candidato = self.rnd.choice(candidatos)["nombre_completo"] if candidatos else "Candidato bench"
+        gobernador = self.rnd.choice(gobernadores) if gobernadores else None
+        self.pedir("/enviar_voto", "POST", "/enviar_voto", headers={"Referer": referer}, data={
+            "csrf_token": RE_CSRF.search(pagina).group(1),
+            "genero": self.rnd.choice(("M", "F")),
+            "pais": pais["nombre_pais"],
+            "departamento": dep["nombre_departamento"],
+            "provincia": prov["nombre_provincia"],
+            "id_municipio": mun["id_municipio"],
+            "municipio_nombre": mun["nombre_municipio"],
+            "recinto": recinto["nombre_recinto"],
+            "dia_nacimiento": str(self.rnd.randint(1, 28)),
+            "mes_nacimiento": str(self.rnd.randint(1, 12)),
+            "anio_nacimiento": str(self.rnd.randint(1950, 2007)),
+            "candidato": candidato,
+            "gobernador": (f"{gobernador['nombre_completo']} — {gobernador['organizacion_politica']}"
+                           if gobernador else ""),
+        })
+
+
+# ---------------------------
+# Comparación con una corrida anterior
+# ---------------------------
+def comparar(actual, anterior):
+    cambios = {}
+    for nombre, datos in actual["endpoints"].items():
+        previo = anterior.get("endpoints", {}).get(nombre)
+        if not previo:
+            continue
+        cambios[nombre] = {}
+        for clave in ("p50_ms", "p95_ms", "p99_ms", "por_seg"):
+            antes, ahora = previo.get(clave), datos.get(clave)
+            cambios[nombre][clave] = {
+                "antes": antes,
+                "ahora": ahora,
+                "cambio_pct": round((ahora / antes - 1) * 100, 1) if antes and ahora is not None else None,
+            }
+    return {"commit": anterior.get("commit"), "fecha": anterior.get("fecha"), "endpoints": cambios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:////tmp/benchmark_funnel.db")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--timeout-enlace", type=float, default=30, help="segundos de espera del enlace por WhatsApp")
+    parser.add_argument("--con-limites", action="store_true", help="no desactivar los límites por IP/número")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", help="archivo JSON donde guardar el resultado")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    puerto_app, puerto_waba = puerto_libre(), puerto_libre()
+    base = f"http://127.0.0.1:{puerto_app}"
+
+    # La app se configura antes de importarla (lee el entorno al importar)
+    os.environ["DATABASE_URL"] = args.url
+    os.environ["WABA_API_URL"] = f"http://127.0.0.1:{puerto_waba}/messages"
+    os.environ["WABA_TOKEN"] = "benchmark"
+    os.environ["AZURE_DOMAIN"] = base
+    os.environ.setdefault("LOG_SALIDA", "stderr")
+    os.environ.setdefault("WHATSAPP_LIMITE_GLOBAL_RAFAGA", "100000")
+    os.environ.setdefault("WHATSAPP_LIMITE_GLOBAL_POR_SEG", "100000")
+    if not args.con_limites:
+        from limite_http import REGLAS
+        for regla in REGLAS:
+            os.environ[f"LIMITE_{regla.upper()}_IP"] = "0"
+            os.environ[f"LIMITE_{regla.upper()}_NUMERO"] = "0"
+
+    buzon = Buzon()
+    waba = servidor_360dialog(buzon, puerto_waba)
+    medidor = Medidor()
+    fallidos = []
+
+    with contextlib.redirect_stdout(sys.stderr):
+        from werkzeug.serving import make_server
+        from app import Voto, app, db
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            dialecto = db.engine.dialect.name
+
+        servidor = make_server("127.0.0.1", puerto_app, app, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+        def correr(i):
+            usuario = Usuario(i, base, buzon, medidor, random.Random(args.semilla * 1_000_003 + i),
+                              args.timeout_enlace)
+            inicio = time.perf_counter()
+            try:
+                usuario.recorrer()
+            except (ErrorEmbudo, KeyError, ValueError, AttributeError) as e:
+                fallidos.append(str(e))
+                return
+            medidor.registrar("embudo_completo", (time.perf_counter() - inicio) * 1000)
+
+        print(f"🏁 {args.usuarios} usuarios, concurrencia {args.concurrencia}, base {dialecto}")
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+            list(pool.map(correr, range(args.usuarios)))
+        duracion = time.perf_counter() - inicio
+
+        servidor.shutdown()
+        waba.shutdown()
+        with app.app_context():
+            votos = db.session.execute(db.select(db.func.count(Voto.id))).scalar()
+
+    resultado = {
+        "commit": commit_actual(),
+        "fecha": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "base": dialecto,
+        "usuarios": args.usuarios,
+        "concurrencia": args.concurrencia,
+        "con_limites": args.con_limites,
+        "duracion_s": round(duracion, 2),
+        "embudos_completos": args.usuarios - len(fallidos),
+        "embudos_por_seg": round((args.usuarios - len(fallidos)) / duracion, 2),
+        "embudos_fallidos": len(fallidos),
+        "errores_ejemplo": sorted(set(fallidos))[:10],
+        "votos_en_base": votos,
+        "whatsapp_enviados": buzon.total,
+        "endpoints": medidor.resumen(duracion),
+    }
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            resultado["comparacion"] = comparar(resultado, json.load(f))
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    print(texto)
+    return 1 if fallidos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# ---------------------------
+# Benchmark de índices de la tabla votos
+# ---------------------------
+"""
+Siembra N votos sintéticos y mide, sin y con los índices de Voto:
+  - el tiempo de cada consulta de auditoría/análisis (mediana de R corridas)
+    y su plan (EXPLAIN),
+  - el costo de escritura (votos insertados por segundo; las dos mediciones
+    insertan los mismos votos sobre la misma tabla de N filas),
+  - el tiempo de construir cada índice.
+El resultado se imprime como JSON.
+
+Usa el mismo esquema que la app (modelo Voto). ¡Borra y recrea la tabla
+votos de la base indicada! Usar una base descartable:
+
+    python benchmark_indices.py --votos 200000
+    python benchmark_indices.py --url postgresql://.../bench --votos 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+DEPARTAMENTOS = ("La Paz", "Santa Cruz", "Cochabamba", "Oruro", "Potosí",
+                 "Chuquisaca", "Tarija", "Beni", "Pando")
+INICIO = datetime(2025, 8, 1)
+DIAS = 10
+
+
+def voto_sintetico(i, rnd):
+    departamento = rnd.choice(DEPARTAMENTOS)
+    id_municipio = str(rnd.randint(1, 340))
+    con_ubicacion = rnd.random() < 0.3
+    return {
+        "numero": f"591{i:09d}",
+        "genero": rnd.choice(("M", "F")),
+        "pais": "Bolivia" if rnd.random() < 0.95 else "Argentina",
+        "departamento": departamento,
+        "provincia": f"Provincia {rnd.randint(1, 20)}",
+        "id_municipio": id_municipio,
+        "municipio": f"Municipio {id_municipio}",
+        "recinto": f"Recinto {rnd.randint(1, 40)}",
+        "dia_nacimiento": rnd.randint(1, 28),
+        "mes_nacimiento": rnd.randint(1, 12),
+        "anio_nacimiento": rnd.randint(1940, 2007),
+        "latitud": round(rnd.uniform(-22.9, -9.7), 4) if con_ubicacion else None,
+        "longitud": round(rnd.uniform(-69.6, -57.5), 4) if con_ubicacion else None,
+        "ip": f"10.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}",
+        "fecha": INICIO + timedelta(seconds=rnd.randint(0, DIAS * 86400)),
+        "gobernador": f"Gobernador {rnd.randint(1, 4)}",
+        "candidato": f"Candidato {rnd.randint(1, 5)}",
+    }
+
+
+def consultas(sa, tabla):
+    c = tabla.c
+    dia = INICIO + timedelta(days=3)
+    return {
+        "votos_de_una_ip_en_1h": sa.select(sa.func.count()).where(
+            c.ip == "10.1.2.3", c.fecha >= dia, c.fecha < dia + timedelta(hours=1)),
+        "votos_en_rango_1h": sa.select(sa.func.count()).where(
+            c.fecha >= dia, c.fecha < dia + timedelta(hours=1)),
+        "departamento_en_un_dia": sa.select(c.id, c.numero, c.candidato).where(
+            c.departamento == "Oruro", c.fecha >= dia, c.fecha < dia + timedelta(days=1)),
+        "resultados_de_un_municipio": sa.select(c.candidato, sa.func.count()).where(
+            c.id_municipio == "123").group_by(c.candidato),
+        "votos_en_misma_zona": sa.select(sa.func.count()).where(
+            c.latitud.between(-16.51, -16.49), c.longitud.between(-68.16, -68.14)),
+    }
+
+
+def plan(conn, sa, consulta):
+    if conn.dialect.name == "sqlite":
+        filas = conn.execute(sa.text("EXPLAIN QUERY PLAN " + _sql(conn, consulta))).all()
+        return " | ".join(f[-1] for f in filas)
+    filas = conn.execute(sa.text("EXPLAIN " + _sql(conn, consulta))).all()
+    return " | ".join(f[0].strip() for f in filas[:3])
+
+
+def _sql(conn, consulta):
+    return str(consulta.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def medir(conn, consulta, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        conn.execute(consulta).all()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 3)
+
+
+def insertar(conn, tabla, desde, cantidad, rnd, lote=5000):
+    inicio = time.perf_counter()
+    for base in range(desde, desde + cantidad, lote):
+        conn.execute(tabla.insert(), [voto_sintetico(i, rnd) for i in range(base, min(base + lote, desde + cantidad))])
+    conn.commit()
+    return time.perf_counter() - inicio
+
+
+def medir_escritura(conn, tabla, desde, cantidad, semilla):
+    """
+    Votos por segundo al insertar `cantidad` votos a partir de `desde`. Después
+    se borran: la tabla vuelve a tener `desde` filas para lo que sigue.
+    """
+    segundos = insertar(conn, tabla, desde, cantidad, random.Random(semilla))
+    conn.execute(tabla.delete().where(tabla.c.numero >= f"591{desde:09d}"))
+    conn.commit()
+    return round(cantidad / segundos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:////tmp/benchmark_votos.db")
+    parser.add_argument("--votos", type=int, default=200_000)
+    parser.add_argument("--escritura", type=int, default=20_000, help="votos para medir el costo de escritura")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+
+    # La app se importa contra la base del benchmark, sin hilos de fondo
+    os.environ["DATABASE_URL"] = args.url
+    os.environ["WHATSAPP_COLA_HILOS"] = "0"
+    os.environ["WEBHOOK_COLA_HILOS"] = "0"
+    os.environ.setdefault("LOG_SALIDA", "stderr")
+    import sqlalchemy as sa
+    from app import Voto, app, db
+
+    tabla = Voto.__table__
+    indices = [i for i in tabla.indexes if not i.unique]
+    rnd = random.Random(args.semilla)
+    resultado = {"url": args.url.split("@")[-1], "votos": args.votos, "repeticiones": args.repeticiones}
+
+    with app.app_context(), db.engine.connect() as conn:
+        tabla.drop(conn, checkfirst=True)
+        tabla.create(conn)
+        for indice in indices:
+            indice.drop(conn)
+        conn.commit()
+
+        print(f"🌱 Sembrando {args.votos} votos...", file=sys.stderr)
+        insertar(conn, tabla, 0, args.votos, rnd)
+        if conn.dialect.name == "postgresql":
+            conn.execute(sa.text("ANALYZE votos"))
+            conn.commit()
+
+        qs = consultas(sa, tabla)
+        antes = {n: (medir(conn, q, args.repeticiones), plan(conn, sa, q)) for n, q in qs.items()}
+        escritura_sin = medir_escritura(conn, tabla, args.votos, args.escritura, args.semilla + 1)
+
+        construccion = {}
+        for indice in indices:
+            inicio = time.perf_counter()
+            indice.create(conn)
+            conn.commit()
+            construccion[indice.name] = round((time.perf_counter() - inicio) * 1000, 1)
+        conn.execute(sa.text("ANALYZE" if conn.dialect.name == "sqlite" else "ANALYZE votos"))
+        conn.commit()
+
+        despues = {n: (medir(conn, q, args.repeticiones), plan(conn, sa, q)) for n, q in qs.items()}
+        escritura_con = medir_escritura(conn, tabla, args.votos, args.escritura, args.semilla + 1)
+
+    resultado["consultas"] = {
+        n: {
+            "antes_ms": antes[n][0],
+            "despues_ms": despues[n][0],
+            "mejora_x": round(antes[n][0] / despues[n][0], 1) if despues[n][0] else None,
+            "plan_antes": antes[n][1],
+            "plan_despues": despues[n][1],
+        }
+        for n in qs
+    }
+    resultado["escritura"] = {
+        "votos_por_seg_sin_indices": escritura_sin,
+        "votos_por_seg_con_indices": escritura_con,
+        "costo_pct": round((escritura_sin / escritura_con - 1) * 100, 1) if escritura_con else None,
+    }
+    resultado["construccion_indices_ms"] = construccion
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# ---------------------------
+# Micro-benchmark de normalización de textos y carga de CSV
+# ---------------------------
+"""
+Compara las funciones de normalización de datos_referencia.py (norm,
+norm_mayusculas, limpiar_numero) con su versión original (copiada abajo
+tal cual: NFKD + filtro de marcas combinantes + regex por llamada), y mide
+los tres cargadores de CSV (leer + construir) con una y otra.
+
+Primero verifica equivalencia: la salida tiene que ser idéntica para cada
+texto de los CSV, para entradas típicas de la API y para casos Unicode
+difíciles; y los cargadores tienen que producir los mismos JSON (ETag). Si
+algo difiere, termina con código 1 (sirve como chequeo en CI con
+--solo-equivalencia).
+
+    python benchmark_normalizacion.py
+    python benchmark_normalizacion.py --escala 10 --repeticiones 7
+    python benchmark_normalizacion.py --solo-equivalencia
+"""
+import argparse
+import contextlib
+import json
+import re
+import statistics
+import sys
+import time
+import unicodedata
+
+import datos_referencia as dr
+
+
+# ---------------------------
+# Versiones originales (referencia)
+# ---------------------------
+def _simplificar_original(s):
+    s = str(s or "").strip()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", s)
+
+
+def norm_original(s):
+    return _simplificar_original(s).lower()
+
+
+def norm_mayusculas_original(s):
+    return _simplificar_original(s).upper()
+
+
+def limpiar_numero_original(numero_raw):
+    numero = unicodedata.normalize("NFKD", str(numero_raw))
+    numero = re.sub(r"\D", "", numero)
+    return numero
+
+
+PARES = (
+    ("norm", norm_original, dr.norm),
+    ("norm_mayusculas", norm_mayusculas_original, dr.norm_mayusculas),
+    ("limpiar_numero", limpiar_numero_original, dr.limpiar_numero),
+)
+
+# Entradas que rompen atajos ingenuos: NBSP, marcas sueltas, compatibilidad
+# (ligaduras, números romanos, ancho completo), dígitos no ASCII, controles.
+CASOS_DIFICILES = (
+    None, "", " ", "\t\n", " Potosí ", "Cochabamba　", "é", "́",
+    "¨", " ¨x", "ﬁnal", "Ⅻ", "ＬＡ ＰＡＺ", "１２３", "٣٤٥", "+591 ７１２-３４５",
+    "ß", "İstanbul", "Ǆ", "Ñuñoa", "São  Paulo", "a​b", "a\x1cb", "x\x85y", "🇧🇴 Bolivia",
+    "+591 71234567", "(591) 7-123-4567", "591.712.34567", 59171234567, 3.5, True,
+)
+
+
+def corpus():
+    """Textos reales de los tres CSV + variantes como llegan a la API + casos difíciles."""
+    textos = []
+    for path in (dr.RECINTOS_CSV_PATH, dr.CANDIDATOS_CSV_PATH, dr.GOBERNADORES_CSV_PATH):
+        _, filas = dr.leer_filas_csv(path, ())
+        for fila in filas:
+            textos.extend(v for v in fila.values() if isinstance(v, str))
+    api = [f" {t.upper()} " for t in textos[:2000]] + [t.lower() for t in textos[:2000]]
+    return textos + api + list(CASOS_DIFICILES)
+
+
+def nombres_lugares(cantidad=50_000):
+    """
+    Lo que reciben las APIs en cada request: nombres de departamento,
+    provincia y municipio (un conjunto finito) repetidos, con variantes
+    de mayúsculas y espacios como las manda el navegador.
+    """
+    _, filas = dr.leer_filas_csv(dr.RECINTOS_CSV_PATH, ())
+    nombres = sorted({
+        fila[c] for fila in filas
+        for c in ("nombre_departamento", "nombre_provincia", "nombre_municipio") if fila.get(c)
+    })
+    variantes = [n for nombre in nombres for n in (nombre, nombre.strip().upper(), f" {nombre} ")]
+    return [variantes[(i * 7919) % len(variantes)] for i in range(cantidad)]
+
+
+def limpiar_caches():
+    dr._simplificar_texto.cache_clear()
+
+
+# ---------------------------
+# Equivalencia
+# ---------------------------
+def verificar_funciones(textos):
+    diferencias = []
+    for nombre, original, actual in PARES:
+        for t in textos:
+            if original(t) != actual(t):
+                diferencias.append({"funcion": nombre, "entrada": repr(t),
+                                    "original": original(t), "actual": actual(t)})
+    return diferencias
+
+
+def _etags(dataset):
+    # Sin cuerpos() no hay nada que comparar: una lista vacía daría la
+    # verificación por buena sin haber verificado nada
+    if not hasattr(dataset, "cuerpos"):
+        raise TypeError(f"{type(dataset).__name__} no tiene cuerpos(): no se puede verificar")
+    return [c.etag for c in dataset.cuerpos()]
+
+
+CARGADORES = (
+    ("recintos", dr.RECINTOS_CSV_PATH, dr.RECINTOS_REQUERIDAS, dr.construir_recintos),
+    ("candidatos", dr.CANDIDATOS_CSV_PATH, dr.CANDIDATOS_REQUERIDAS, dr.construir_candidatos),
+    ("gobernadores", dr.GOBERNADORES_CSV_PATH, dr.GOBERNADORES_REQUERIDAS, dr.construir_gobernadores),
+)
+
+
+@contextlib.contextmanager
+def normalizacion_original():
+    """Reemplaza temporalmente norm/norm_mayusculas del módulo por las originales."""
+    previas = dr.norm, dr.norm_mayusculas
+    dr.norm, dr.norm_mayusculas = norm_original, norm_mayusculas_original
+    try:
+        yield
+    finally:
+        dr.norm, dr.norm_mayusculas = previas
+
+
+def verificar_cargadores(filas_por_cargador):
+    diferencias = []
+    for nombre, _, _, construir in CARGADORES:
+        filas = filas_por_cargador[nombre]
+        with normalizacion_original():
+            original = construir(filas)
+        actual = construir(filas)
+        if _etags(original) != _etags(actual):
+            diferencias.append({"cargador": nombre})
+    return diferencias
+
+
+# ---------------------------
+# Tiempos
+# ---------------------------
+def medir(funcion, repeticiones, preparar=None):
+    """Mediana (segundos) de `repeticiones` corridas de funcion()."""
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def medir_funciones(textos, repeticiones, pares=PARES):
+    resultado = {}
+    n = len(textos)
+    for nombre, original, actual in pares:
+        def correr(f):
+            return lambda: [f(t) for t in textos]
+        t_original = medir(correr(original), repeticiones)
+        t_frio = medir(correr(actual), repeticiones, preparar=limpiar_caches)
+        t_caliente = medir(correr(actual), repeticiones)
+        resultado[nombre] = {
+            "llamadas": n,
+            "original_ns": round(t_original / n * 1e9, 1),
+            "actual_frio_ns": round(t_frio / n * 1e9, 1),
+            "actual_caliente_ns": round(t_caliente / n * 1e9, 1),
+            "mejora_x_frio": round(t_original / t_frio, 2),
+            "mejora_x_caliente": round(t_original / t_caliente, 2),
+        }
+    return resultado
+
+
+def escalar(filas, escala):
+    """Repite las filas `escala` veces con ids distintos (tamaño de un padrón más grande)."""
+    if escala <= 1:
+        return filas
+    escaladas = []
+    for k in range(escala):
+        for fila in filas:
+            copia = dict(fila)
+            for columna in ("id_recinto", "id_nombre_completo"):
+                if copia.get(columna):
+                    copia[columna] = f"{copia[columna]}{k:03d}"
+            escaladas.append(copia)
+    return escaladas
+
+
+def medir_cargadores(filas_por_cargador, repeticiones):
+    resultado = {}
+    for nombre, path, requeridas, construir in CARGADORES:
+        filas = filas_por_cargador[nombre]
+
+        def construir_original():
+            with normalizacion_original():
+                construir(filas)
+
+        t_leer = medir(lambda: dr.leer_filas_csv(path, requeridas), repeticiones)
+        t_original = medir(construir_original, repeticiones)
+        t_actual = medir(lambda: construir(filas), repeticiones, preparar=limpiar_caches)
+        resultado[nombre] = {
+            "filas": len(filas),
+            "leer_csv_ms": round(t_leer * 1000, 2),
+            "construir_original_ms": round(t_original * 1000, 2),
+            "construir_actual_ms": round(t_actual * 1000, 2),
+            "mejora_x": round(t_original / t_actual, 2),
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--escala", type=int, default=1, help="multiplica las filas de los CSV")
+    parser.add_argument("--solo-equivalencia", action="store_true")
+    args = parser.parse_args()
+
+    textos = corpus()
+    filas_por_cargador = {
+        nombre: escalar(dr.leer_filas_csv(path, requeridas)[1], args.escala)
+        for nombre, path, requeridas, _ in CARGADORES
+    }
+
+    diferencias = verificar_funciones(textos) + verificar_cargadores(filas_por_cargador)
+    resultado = {
+        "equivalencia": {
+            "textos": len(textos),
+            "ok": not diferencias,
+            "diferencias": diferencias[:20],
+        },
+    }
+    if not args.solo_equivalencia and not diferencias:
+        resultado["funciones"] = {
+            # Todas las celdas de los CSV: casi todas distintas (carga inicial)
+            "textos_csv": medir_funciones(textos, args.repeticiones),
+            # Nombres de lugares repetidos (camino caliente de /api/*)
+            "nombres_lugares": medir_funciones(nombres_lugares(), args.repeticiones, PARES[:2]),
+        }
+        # La construcción incluye serializar y comprimir (gzip/brotli) cada JSON
+        resultado["cargadores"] = medir_cargadores(filas_por_cargador, args.repeticiones)
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    return 1 if diferencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
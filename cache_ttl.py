@@ -0,0 +1,73 @@
+# ---------------------------
+# Cache en memoria acotado (LRU + TTL)
+# ---------------------------
+"""
+Cache por proceso, seguro entre hilos, con tamaño máximo (se descarta la
+entrada menos usada) y vencimiento por entrada. Sirve para evitar viajes a
+la base en caminos calientes; la base sigue siendo la fuente de verdad
+(cada worker de gunicorn tiene su propia copia).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_FALTA = object()
+
+
+class CacheTTL:
+    def __init__(self, max_claves=50_000, ttl_segundos=3600.0):
+        self.max_claves = max_claves
+        self.ttl = ttl_segundos
+        self._datos = OrderedDict()  # clave -> (valor, vence)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, defecto=None):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave, _FALTA)
+            if entrada is not _FALTA:
+                valor, vence = entrada
+                if vence > ahora:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+            self.fallos += 1
+            return defecto
+
+    def __contains__(self, clave):
+        return self.obtener(clave, _FALTA) is not _FALTA
+
+    def __len__(self):
+        # Incluye entradas vencidas que aún no se consultaron (solo orientativo)
+        return len(self._datos)
+
+    def guardar(self, clave, valor=True, ttl_segundos=None):
+        vence = time.monotonic() + (self.ttl if ttl_segundos is None else ttl_segundos)
+        with self._lock:
+            self._datos[clave] = (valor, vence)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_claves:
+                self._datos.popitem(last=False)
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "claves": len(self._datos),
+                "max_claves": self.max_claves,
+                "ttl_segundos": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "ratio_aciertos": round(self.aciertos / total, 3) if total else None,
+            }
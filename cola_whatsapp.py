@@ -0,0 +1,342 @@
+# ---------------------------
+# Colas persistentes de WhatsApp (salida y webhooks entrantes)
+# ---------------------------
+"""
+Colas persistentes (en la misma base de datos) para el trabajo de WhatsApp
+que no debe hacerse dentro del request:
+
+- ColaWhatsapp: mensajes salientes a 360dialog.
+- ColaWebhooks: payloads crudos recibidos en /whatsapp; se procesan completos
+  (todas las entries/changes/messages/statuses) en segundo plano.
+
+Los handlers solo encolan (un INSERT dentro de su propio commit) y responden
+enseguida; un pool acotado de hilos por proceso procesa los elementos con
+reintentos y backoff exponencial. Los que agotan los intentos (o fallan de
+forma no recuperable) quedan con estado "muerto" (dead-letter) para revisión.
+
+Cada elemento se "reserva" con un UPDATE condicional que funciona igual en
+Postgres y SQLite: el primer hilo que logra mover `proximo_intento` hacia
+adelante se lo queda. Si el proceso muere a mitad de un envío, la reserva
+vence (LEASE_SEGUNDOS) y otro hilo lo retoma, así un reinicio no pierde
+nada.
+
+Durante procesar() (la llamada HTTP a 360dialog, o el lote del webhook) el
+hilo no tiene una conexión del pool tomada: la reserva se confirma, procesar
+recibe solo los valores que necesita (una fila, sin sesión) y el resultado se
+registra después, recargando el elemento por id.
+
+Si el limitador de tasa no da cupo, el mensaje se reprograma para cuando
+haya token, sin contar como intento fallido.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from limitador import LimiteExcedido
+from logs_estructurados import contexto_log
+from sql_portable import borrar_en_lotes
+
+log = logging.getLogger("votaciones.colas")
+
+PENDIENTE = "pendiente"
+ENVIANDO = "enviando"
+ENVIADO = "enviado"
+PROCESADO = "procesado"
+MUERTO = "muerto"
+
+
+class ColaPersistente:
+    """
+    Base común. El modelo necesita las columnas id, estado, intentos,
+    proximo_intento y ultimo_error; las subclases declaran en `campos` las
+    columnas que usa procesar(datos) -> (ok, reintentable, detalle), que
+    recibe esos valores (y el id) en una fila sin sesión.
+    """
+
+    nombre = "cola"
+    prefijo_env = "COLA"
+    estado_ok = PROCESADO
+    campos = ()
+
+    def __init__(self, app, db, modelo):
+        self.app = app
+        self.db = db
+        self.modelo = modelo
+
+        def conf(clave, defecto):
+            return os.environ.get(f"{self.prefijo_env}_{clave}", defecto)
+
+        self.hilos = int(conf("HILOS", "4"))
+        self.max_intentos = int(conf("MAX_INTENTOS", "6"))
+        self.backoff_base = float(conf("BACKOFF_SEGUNDOS", "2"))
+        self.backoff_max = float(conf("BACKOFF_MAX_SEGUNDOS", "300"))
+        self.lease = float(conf("LEASE_SEGUNDOS", "60"))
+        self.espera = float(conf("ESPERA_SEGUNDOS", "2"))
+        self.lote = int(conf("LOTE", "20"))
+
+        self._despertar = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def procesar(self, datos):
+        raise NotImplementedError
+
+    def al_completar(self, elemento, detalle):
+        """Se llama tras un procesamiento exitoso, antes del commit."""
+
+    def describir(self, elemento):
+        return f"#{elemento.id}"
+
+    # ---------------------------
+    # Productores
+    # ---------------------------
+    def _encolar(self, commit, **campos):
+        """
+        Agrega el elemento a la sesión actual. Con commit=False el INSERT viaja
+        en el commit del handler (una sola transacción) y el handler debe
+        llamar a despertar() después de su commit.
+        """
+        self.db.session.add(self.modelo(
+            estado=PENDIENTE,
+            intentos=0,
+            proximo_intento=datetime.utcnow(),
+            **campos
+        ))
+        if commit:
+            self.db.session.commit()
+            self.despertar()
+
+    def despertar(self):
+        self.asegurar_hilos()
+        self._despertar.set()
+
+    # ---------------------------
+    # Pool de hilos (uno por proceso; con gunicorn cada worker arranca el suyo)
+    # ---------------------------
+    def asegurar_hilos(self):
+        if self.hilos <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.hilos):
+                threading.Thread(target=self._bucle, name=f"{self.nombre}-{i}", daemon=True).start()
+
+    def _bucle(self):
+        while True:
+            try:
+                procesados = self.procesar_lote()
+            except Exception as e:
+                log.error("Error en la cola", extra={"cola": self.nombre, "error": str(e)})
+                procesados = 0
+            if not procesados:
+                self._despertar.wait(self.espera)
+                self._despertar.clear()
+
+    # ---------------------------
+    # Consumidor
+    # ---------------------------
+    def procesar_lote(self):
+        """Procesa los elementos vencidos (se puede llamar a mano). Devuelve cuántos tomó."""
+        M = self.modelo
+        with self.app.app_context():
+            ahora = datetime.utcnow()
+            candidatos = self.db.session.execute(
+                self.db.select(M.id)
+                .where(M.estado.in_((PENDIENTE, ENVIANDO)), M.proximo_intento <= ahora)
+                .order_by(M.proximo_intento)
+                .limit(self.lote)
+            ).scalars().all()
+
+            tomados = 0
+            for id_elemento in candidatos:
+                datos = self._reservar(id_elemento)
+                if datos is None:
+                    continue  # otro hilo/worker lo tomó
+                tomados += 1
+                if not self._ejecutar(datos):
+                    break  # sin cupo: el resto del lote esperaría igual
+            self.db.session.remove()
+            return tomados
+
+    def _reservar(self, id_elemento):
+        """
+        Toma el elemento y devuelve sus `campos` como valores planos (o None
+        si otro lo tomó). Al volver, la transacción ya está confirmada y la
+        conexión devuelta al pool.
+        """
+        M = self.modelo
+        ahora = datetime.utcnow()
+        resultado = self.db.session.execute(
+            self.db.update(M)
+            .where(M.id == id_elemento,
+                   M.estado.in_((PENDIENTE, ENVIANDO)),
+                   M.proximo_intento <= ahora)
+            .values(estado=ENVIANDO,
+                    intentos=M.intentos + 1,
+                    proximo_intento=ahora + timedelta(seconds=self.lease))
+        )
+        datos = None
+        if resultado.rowcount == 1:
+            datos = self.db.session.execute(
+                self.db.select(M.id, *(getattr(M, c) for c in self.campos)).where(M.id == id_elemento)
+            ).one()
+        self.db.session.commit()
+        return datos
+
+    def _ejecutar(self, datos):
+        """Devuelve False si el limitador no dio cupo."""
+        M = self.modelo
+        id_elemento = datos.id
+        try:
+            # Los logs de procesar() llevan la cola y el id del elemento
+            with contexto_log(cola=self.nombre, elemento=id_elemento):
+                ok, reintentable, detalle = self.procesar(datos)
+        except LimiteExcedido as e:
+            self.db.session.rollback()
+            elemento = self.db.session.get(M, id_elemento)
+            elemento.estado = PENDIENTE
+            elemento.intentos -= 1  # no cuenta como intento
+            elemento.proximo_intento = datetime.utcnow() + timedelta(seconds=e.espera)
+            self.db.session.commit()
+            return False
+        except Exception as e:
+            # procesar() pudo dejar la sesión a medias: se descarta
+            self.db.session.rollback()
+            ok, reintentable, detalle = False, True, str(e)
+
+        # Recién ahora se vuelve a la base, para registrar el resultado
+        elemento = self.db.session.get(M, id_elemento)
+
+        if ok:
+            elemento.estado = self.estado_ok
+            elemento.ultimo_error = None
+            self.al_completar(elemento, detalle)
+        elif reintentable and elemento.intentos < self.max_intentos:
+            espera = min(self.backoff_max, self.backoff_base * (2 ** (elemento.intentos - 1)))
+            elemento.estado = PENDIENTE
+            elemento.proximo_intento = datetime.utcnow() + timedelta(seconds=espera)
+            elemento.ultimo_error = (detalle or "")[:300]
+            log.warning("Elemento falló; se reintentará", extra={
+                "cola": self.nombre, "elemento": id_elemento, "descripcion": self.describir(elemento),
+                "intento": elemento.intentos, "reintento_s": round(espera), "error": elemento.ultimo_error,
+            })
+        else:
+            elemento.estado = MUERTO
+            elemento.ultimo_error = (detalle or "")[:300]
+            log.error("Elemento descartado (dead-letter)", extra={
+                "cola": self.nombre, "elemento": id_elemento, "descripcion": self.describir(elemento),
+                "intentos": elemento.intentos, "error": elemento.ultimo_error,
+            })
+        self.db.session.commit()
+        return True
+
+    # ---------------------------
+    # Dead-letter
+    # ---------------------------
+    def reencolar_muertos(self, limite=500):
+        """Vuelve a poner en cola los elementos muertos (tras arreglar el problema)."""
+        M = self.modelo
+        with self.app.app_context():
+            ids = self.db.session.execute(
+                self.db.select(M.id).where(M.estado == MUERTO).limit(limite)
+            ).scalars().all()
+            if ids:
+                self.db.session.execute(
+                    self.db.update(M).where(M.id.in_(ids))
+                    .values(estado=PENDIENTE, intentos=0, proximo_intento=datetime.utcnow())
+                )
+                self.db.session.commit()
+        self.despertar()
+        return len(ids)
+
+    def esperar_vacia(self, timeout=10.0):
+        """Espera a que no queden pendientes (útil contra un servidor stub local)."""
+        M = self.modelo
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            with self.app.app_context():
+                quedan = self.db.session.execute(
+                    self.db.select(self.db.func.count(M.id)).where(M.estado.in_((PENDIENTE, ENVIANDO)))
+                ).scalar()
+                self.db.session.remove()
+            if not quedan:
+                return True
+            self.despertar()
+            time.sleep(0.05)
+        return False
+
+    def purgar(self, antiguedad, lote=1000):
+        """Borra los elementos completados más viejos que `antiguedad` (timedelta)."""
+        M = self.modelo
+        with self.app.app_context():
+            return borrar_en_lotes(
+                self.db.session, M,
+                (M.estado == self.estado_ok) & (M.fecha < datetime.utcnow() - antiguedad),
+                lote,
+            )
+
+    def contar_por_estado(self):
+        M = self.modelo
+        return dict(self.db.session.execute(
+            self.db.select(M.estado, self.db.func.count(M.id)).group_by(M.estado)
+        ).all())
+
+
+class ColaWhatsapp(ColaPersistente):
+    """Mensajes salientes a 360dialog."""
+
+    nombre = "cola-whatsapp"
+    prefijo_env = "WHATSAPP_COLA"
+    estado_ok = ENVIADO
+    campos = ("numero", "texto")
+
+    def __init__(self, app, db, modelo, entregar):
+        """
+        modelo:   clase SQLAlchemy de la tabla de mensajes salientes
+        entregar: función (numero, texto) -> (ok, reintentable, detalle);
+                  si ok, `detalle` es el id del mensaje en WhatsApp (wamid)
+        """
+        super().__init__(app, db, modelo)
+        self.entregar = entregar
+
+    def encolar(self, numero, texto, commit=True):
+        self._encolar(commit, numero=numero, texto=texto)
+
+    def procesar(self, mensaje):
+        return self.entregar(mensaje.numero, mensaje.texto)
+
+    def al_completar(self, mensaje, wamid):
+        mensaje.fecha_envio = datetime.utcnow()
+        mensaje.wamid = wamid or None
+
+    def describir(self, mensaje):
+        return f"WhatsApp a {mensaje.numero}"
+
+
+class ColaWebhooks(ColaPersistente):
+    """Payloads crudos del webhook de WhatsApp."""
+
+    nombre = "cola-webhooks"
+    prefijo_env = "WEBHOOK_COLA"
+    estado_ok = PROCESADO
+    campos = ("payload", "host_url")
+
+    def __init__(self, app, db, modelo, procesar_payload):
+        """
+        modelo:           clase SQLAlchemy de la tabla de webhooks recibidos
+        procesar_payload: función (payload, host_url) que procesa el lote
+                          completo; si lanza una excepción, se reintenta
+        """
+        super().__init__(app, db, modelo)
+        self.procesar_payload = procesar_payload
+
+    def encolar(self, payload, host_url, commit=True):
+        self._encolar(commit, payload=payload, host_url=host_url)
+
+    def procesar(self, recibido):
+        self.procesar_payload(recibido.payload, recibido.host_url)
+        return True, False, None
@@ -0,0 +1,151 @@
+# ---------------------------
+# Configuración del engine / pool de conexiones
+# ---------------------------
+"""
+Opciones de SQLAlchemy tomadas del entorno, pensadas para un Postgres
+gestionado remoto (Azure):
+
+  DB_POOL_SIZE              conexiones persistentes por worker (5)
+  DB_MAX_OVERFLOW           conexiones extra temporales (10)
+  DB_POOL_TIMEOUT           segundos esperando una conexión libre (10)
+  DB_POOL_RECYCLE           renovar conexiones más viejas que esto, s (1800)
+  DB_POOL_PRE_PING          validar la conexión antes de usarla (1)
+  DB_CONNECT_TIMEOUT        timeout de conexión TCP, s (5)
+  DB_STATEMENT_TIMEOUT_MS   corta consultas colgadas (15000; 0 = sin límite)
+  DB_IDLE_TX_TIMEOUT_MS     corta transacciones abiertas ociosas (60000)
+
+Cada worker de gunicorn tiene su propio pool, y los hilos de las colas de
+WhatsApp también toman conexiones: el máximo por worker es
+DB_POOL_SIZE + DB_MAX_OVERFLOW, y eso por la cantidad de workers tiene que
+entrar en max_connections del servidor.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+def _entero(nombre, defecto):
+    return int(os.environ.get(nombre, defecto))
+
+
+class PoolMedido(QueuePool):
+    """
+    QueuePool que además mide cuánto se espera por una conexión.
+
+    El evento "checkout" del pool se dispara cuando la conexión ya se
+    obtuvo, sin saber cuánto tardó; por eso se envuelve _do_get(), método
+    interno de QueuePool (revisar al actualizar SQLAlchemy). Solo cuenta
+    como espera el checkout que encontró el pool lleno (sin conexiones
+    libres ni overflow disponible); abrir una conexión nueva no lo es.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._medicion = threading.Lock()
+        self.checkouts = 0
+        self.esperas = 0  # checkouts que encontraron el pool lleno
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.agotado = 0  # veces que se venció DB_POOL_TIMEOUT
+
+    def _do_get(self):
+        lleno = (self.checkedin() == 0 and self._max_overflow > -1  # -1: overflow sin límite
+                 and self.overflow() >= self._max_overflow)
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._medicion:
+                self.agotado += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._medicion:
+                self.checkouts += 1
+                if lleno:
+                    self.esperas += 1
+                    self.espera_total += espera
+                    self.espera_max = max(self.espera_max, espera)
+
+
+def opciones_engine(url):
+    """Devuelve el dict para SQLALCHEMY_ENGINE_OPTIONS según el dialecto de `url`."""
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") == "sqlite:"):
+        return {}  # SQLite en memoria: el pool por defecto es el correcto
+
+    opciones = {
+        "poolclass": PoolMedido,
+        "pool_size": _entero("DB_POOL_SIZE", "5"),
+        "max_overflow": _entero("DB_MAX_OVERFLOW", "10"),
+        "pool_timeout": _entero("DB_POOL_TIMEOUT", "10"),
+        "pool_recycle": _entero("DB_POOL_RECYCLE", "1800"),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") not in ("0", "false", "False"),
+    }
+
+    if url.startswith(("postgresql", "postgres")):
+        opciones_pg = []
+        statement_timeout = _entero("DB_STATEMENT_TIMEOUT_MS", "15000")
+        if statement_timeout:
+            opciones_pg.append(f"-c statement_timeout={statement_timeout}")
+        idle_tx = _entero("DB_IDLE_TX_TIMEOUT_MS", "60000")
+        if idle_tx:
+            opciones_pg.append(f"-c idle_in_transaction_session_timeout={idle_tx}")
+        opciones["connect_args"] = {
+            "connect_timeout": _entero("DB_CONNECT_TIMEOUT", "5"),
+            "application_name": os.environ.get("DB_APPLICATION_NAME", "votaciones"),
+            # keepalives TCP: detecta conexiones cortadas por el balanceador
+            "keepalives": 1,
+            "keepalives_idle": 60,
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+        }
+        if opciones_pg:
+            opciones["connect_args"]["options"] = " ".join(opciones_pg)
+    elif url.startswith("sqlite"):
+        opciones["connect_args"] = {"timeout": _entero("DB_CONNECT_TIMEOUT", "5")}
+
+    return opciones
+
+
+def resumen_opciones(url, opciones):
+    """Línea para el log de arranque (sin credenciales)."""
+    dialecto = url.split(":", 1)[0]
+    if not opciones:
+        return f"{dialecto} (pool por defecto)"
+    partes = [
+        f"pool_size={opciones['pool_size']}",
+        f"max_overflow={opciones['max_overflow']}",
+        f"timeout={opciones['pool_timeout']}s",
+        f"recycle={opciones['pool_recycle']}s",
+        f"pre_ping={opciones['pool_pre_ping']}",
+    ]
+    pg = opciones.get("connect_args", {}).get("options")
+    if pg:
+        partes.append(pg)
+    return f"{dialecto}: " + ", ".join(partes)
+
+
+def estadisticas_pool(engine):
+    pool = engine.pool
+    datos = {"clase": type(pool).__name__, "estado": pool.status()}
+    if isinstance(pool, QueuePool):
+        datos.update({
+            "tamano": pool.size(),
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+        })
+    if isinstance(pool, PoolMedido):
+        with pool._medicion:
+            datos.update({
+                "checkouts": pool.checkouts,
+                "esperas": pool.esperas,
+                "espera_promedio_ms": round(pool.espera_total / pool.esperas * 1000, 2) if pool.esperas else None,
+                "espera_max_ms": round(pool.espera_max * 1000, 2),
+                "timeouts": pool.agotado,
+            })
+    return datos
@@ -0,0 +1,188 @@
+# ---------------------------
+# Escrutinio: conteos incrementales de votos
+# ---------------------------
+"""
+Mantiene los totales por candidato (y por gobernador) en cada nivel
+geográfico en una tabla de agregados (`conteo_votos`), que se actualiza en
+la misma transacción que inserta el voto. Leer resultados nunca escanea la
+tabla `votos`.
+
+Cada voto suma 1 en una fila por dimensión:
+
+  candidato      valor = ""                      opcion = candidato
+  pais           valor = pais                    opcion = candidato
+  departamento   valor = departamento            opcion = candidato
+  provincia      valor = departamento/provincia  opcion = candidato
+  id_municipio   valor = id_municipio            opcion = candidato
+  recinto        valor = id_municipio/recinto    opcion = candidato
+  gobernador     valor = departamento            opcion = gobernador
+
+Las filas más calientes (el total nacional de cada candidato) reciben todos
+los votos; para que los commits concurrentes no se encolen en el mismo lock
+de fila, cada conteo se reparte en N fragmentos (se elige uno al azar por
+voto) y al leer se suman.
+
+Las lecturas se sirven desde un cuerpo JSON cacheado unos segundos por
+worker (ver CuerpoJSON en datos_referencia.py): el costo por request es
+servir bytes ya comprimidos.
+"""
+import os
+import random
+import threading
+import time
+
+from datos_referencia import CuerpoJSON
+from sql_portable import sumar_en_conflicto
+
+# (dimension, columnas del voto que forman el valor, columna de la opción)
+DIMENSIONES = (
+    ("candidato", (), "candidato"),
+    ("pais", ("pais",), "candidato"),
+    ("departamento", ("departamento",), "candidato"),
+    ("provincia", ("departamento", "provincia"), "candidato"),
+    ("id_municipio", ("id_municipio",), "candidato"),
+    ("recinto", ("id_municipio", "recinto"), "candidato"),
+    ("gobernador", ("departamento",), "gobernador"),
+)
+NOMBRES_DIMENSIONES = tuple(d for d, _, _ in DIMENSIONES)
+
+
+def _valor(voto, columnas):
+    return "/".join(str(voto.get(c) or "") for c in columnas)
+
+
+class Escrutinio:
+    def __init__(self, db, modelo_conteo, modelo_voto):
+        """
+        modelo_conteo: tabla con PK (dimension, valor, opcion, fragmento) y columna total
+        modelo_voto:   tabla de votos (solo para recontar())
+        """
+        self.db = db
+        self.conteo = modelo_conteo
+        self.voto = modelo_voto
+        self.fragmentos = int(os.environ.get("RESULTADOS_FRAGMENTOS", "8"))
+        self.ttl = float(os.environ.get("RESULTADOS_CACHE_SEGUNDOS", "2"))
+        self._cache = {}  # dimension -> (CuerpoJSON, vence)
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # Escritura (dentro de la transacción del voto)
+    # ---------------------------
+    def filas(self, voto, fragmento=0):
+        filas = []
+        for dimension, columnas, columna_opcion in DIMENSIONES:
+            opcion = voto.get(columna_opcion)
+            if not opcion:
+                continue  # p. ej. voto sin gobernador
+            filas.append({
+                "dimension": dimension,
+                "valor": _valor(voto, columnas),
+                "opcion": opcion,
+                "fragmento": fragmento,
+                "total": 1,
+            })
+        return filas
+
+    def sumar_voto(self, voto, condicion=None):
+        """
+        Sentencia que suma `voto` (dict con las columnas de Voto) a los
+        conteos. `condicion` permite encadenarla al INSERT del voto
+        (ver insertar_si_no_existe_y_luego).
+        """
+        return sumar_en_conflicto(
+            self.db.session, self.conteo,
+            self.filas(voto, random.randrange(self.fragmentos)),
+            ["dimension", "valor", "opcion", "fragmento"], "total",
+            condicion,
+        )
+
+    def recontar(self):
+        """
+        Reconstruye los conteos desde la tabla de votos (una vez, p. ej. al
+        activar el escrutinio sobre una base que ya tiene votos, o para
+        auditar). Devuelve la cantidad de votos contados.
+
+        Puede correr con la votación abierta: todo va en una transacción y
+        los votos nuevos esperan a que termine. En Postgres se toma la tabla
+        de votos en SHARE MODE (los INSERT esperan; un voto ya insertado y sin
+        commit hace esperar al LOCK) y se levanta el statement_timeout de la
+        conexión para el GROUP BY completo. En SQLite el DELETE va primero:
+        toma el lock de escritura antes de leer los votos.
+        """
+        V, C = self.voto, self.conteo
+        session = self.db.session
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(self.db.text("SET LOCAL statement_timeout = 0"))
+            session.execute(self.db.text(f'LOCK TABLE "{V.__table__.name}" IN SHARE MODE'))
+        session.execute(self.db.delete(C))
+
+        columnas = sorted({c for _, cols, op in DIMENSIONES for c in cols + (op,)})
+        agrupado = self.db.session.execute(
+            self.db.select(*(getattr(V, c) for c in columnas), self.db.func.count(V.id))
+            .group_by(*(getattr(V, c) for c in columnas))
+        ).all()
+
+        totales = {}
+        votos = 0
+        for fila in agrupado:
+            voto = dict(zip(columnas, fila[:-1]))
+            n = fila[-1]
+            votos += n
+            for f in self.filas(voto):
+                clave = (f["dimension"], f["valor"], f["opcion"])
+                totales[clave] = totales.get(clave, 0) + n
+
+        if totales:
+            self.db.session.execute(self.db.insert(C), [
+                {"dimension": d, "valor": v, "opcion": o, "fragmento": 0, "total": n}
+                for (d, v, o), n in totales.items()
+            ])
+        self.db.session.commit()
+        self.invalidar()
+        return votos
+
+    # ---------------------------
+    # Lectura
+    # ---------------------------
+    def invalidar(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _consultar(self, dimension):
+        C = self.conteo
+        filas = self.db.session.execute(
+            self.db.select(C.valor, C.opcion, self.db.func.sum(C.total))
+            .where(C.dimension == dimension)
+            .group_by(C.valor, C.opcion)
+        ).all()
+
+        resultados = {}
+        total = 0
+        for valor, opcion, n in filas:
+            resultados.setdefault(valor, {})[opcion] = int(n)
+            total += int(n)
+        # Opciones ordenadas de mayor a menor (el dashboard las muestra así)
+        resultados = {
+            valor: dict(sorted(opciones.items(), key=lambda kv: (-kv[1], kv[0])))
+            for valor, opciones in sorted(resultados.items())
+        }
+        return {
+            "dimension": dimension,
+            "total": total,
+            "resultados": resultados,
+        }
+
+    def resultados(self, dimension):
+        """CuerpoJSON de una dimensión; se recalcula a lo sumo cada `ttl` segundos."""
+        ahora = time.monotonic()
+        entrada = self._cache.get(dimension)
+        if entrada is not None and entrada[1] > ahora:
+            return entrada[0]
+        with self._lock:
+            entrada = self._cache.get(dimension)
+            if entrada is not None and entrada[1] > ahora:
+                return entrada[0]
+            # Mismo conteo => mismo ETag: el dashboard recibe 304 si nada cambió
+            cuerpo = CuerpoJSON(self._consultar(dimension))
+            self._cache[dimension] = (cuerpo, time.monotonic() + self.ttl)
+            return cuerpo
@@ -0,0 +1,576 @@
+# ---------------------------
+# Datos de referencia (CSV en privado/) cargados en memoria
+# ---------------------------
+"""
+Registro único de datos de referencia (los CSV de privado/).
+
+Cada CSV se lee y valida UNA sola vez, se guarda en una estructura compacta
+e inmutable (tuplas / MappingProxyType) y la respuesta JSON se serializa por
+adelantado junto con su ETag y sus variantes comprimidas (gzip y, si está
+instalado, brotli). Si el archivo cambia en disco (mtime) o se pide una
+recarga desde admin, se reconstruye y se reemplaza de forma atómica.
+Cada dataset expone `version` (hash del contenido del CSV).
+
+Si existe un snapshot compilado (snapshot_datos.py) y su versión coincide con
+la del CSV, las filas y los JSON ya comprimidos se toman del snapshot (mmap)
+en lugar de parsear y comprimir; si está viejo se usa el CSV.
+"""
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+
+from flask import Response, request
+
+from snapshot_datos import Snapshot
+
+try:
+    import brotli  # opcional
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+
+log = logging.getLogger("votaciones.datos")
+
+PRIVADO_DIR = os.path.join(os.path.dirname(__file__), "privado")
+RECINTOS_CSV_PATH = os.path.join(PRIVADO_DIR, "RecintosParaPrimaria.csv")
+CANDIDATOS_CSV_PATH = os.path.join(PRIVADO_DIR, "CandidatosPorMunicipio.csv")
+GOBERNADORES_CSV_PATH = os.path.join(PRIVADO_DIR, "gobernaciones_por_departamento.csv")
+SNAPSHOT_PATH = os.environ.get("DATOS_SNAPSHOT", os.path.join(PRIVADO_DIR, "datos_referencia.snap"))
+
+# Cada cuántos segundos (como máximo) se revisa el mtime de los CSV
+INTERVALO_REVISION_MTIME = float(os.environ.get("DATOS_REVISION_SEGUNDOS", "2"))
+
+# Cache HTTP para navegadores/CDN (el ETag permite revalidar barato)
+CACHE_CONTROL_DATOS = os.environ.get("DATOS_CACHE_CONTROL", "public, max-age=300")
+
+# Calidad brotli: 11 tarda segundos con el listado completo; 9 pesa casi lo mismo
+BROTLI_CALIDAD = int(os.environ.get("DATOS_BROTLI_CALIDAD", "9"))
+
+
+class ErrorDatos(Exception):
+    """CSV inexistente o con columnas incompletas."""
+
+
+# Snapshot abierto (o None): ver abrir_snapshot()
+_SNAPSHOT = None
+
+
+def abrir_snapshot(path=SNAPSHOT_PATH):
+    """Abre (o reabre) el snapshot compilado. Sin snapshot se trabaja con los CSV."""
+    global _SNAPSHOT
+    if not os.path.exists(path):
+        _SNAPSHOT = None
+        return None
+    try:
+        _SNAPSHOT = Snapshot(path)
+    except Exception as e:
+        log.warning("Snapshot de datos ignorado", extra={"path": path, "error": str(e)})
+        _SNAPSHOT = None
+    return _SNAPSHOT
+
+
+# ---------------------------
+# Normalización de textos (única para todos los CSV y APIs)
+# ---------------------------
+# Se llaman miles de veces al cargar los CSV y en cada request a /api/*. Los
+# nombres (departamentos, provincias, municipios, cargos) son un conjunto
+# finito: el resultado se memoiza. Un texto ASCII no cambia con NFKD ni
+# tiene marcas combinantes, así que se saltan esos pasos.
+# Equivalencia y tiempos contra la versión anterior: benchmark_normalizacion.py
+_ESPACIOS = re.compile(r"\s+")
+_NO_DIGITOS = re.compile(r"\D")
+_BORRAR_NO_DIGITOS_ASCII = dict.fromkeys(c for c in range(128) if not "0" <= chr(c) <= "9")
+
+
+@lru_cache(maxsize=16384)
+def _simplificar_texto(s):
+    if not s.isascii():
+        s = unicodedata.normalize("NFKD", s)
+        s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return _ESPACIOS.sub(" ", s)
+
+
+def estadisticas_normalizacion():
+    """Aciertos/fallos del cache de normalización (para métricas)."""
+    info = _simplificar_texto.cache_info()
+    return {"aciertos": info.hits, "fallos": info.misses, "claves": info.currsize}
+
+
+def _simplificar(s):
+    """Sin espacios extremos, sin tildes y con espacios internos colapsados."""
+    return _simplificar_texto(str(s or "").strip())
+
+
+def norm(s):
+    """Clave de búsqueda: 'Potosí ' -> 'potosi'."""
+    return _simplificar(s).lower()
+
+
+def norm_mayusculas(s):
+    """Nombre para mostrar/agrupar: 'Tarvita ' -> 'TARVITA'."""
+    return _simplificar(s).upper()
+
+
+def limpiar_numero(numero_raw):
+    """Devuelve SOLO dígitos. Ej: '59178194036' """
+    numero = str(numero_raw)
+    if numero.isascii():
+        return numero.translate(_BORRAR_NO_DIGITOS_ASCII)
+    # \D de re es Unicode: conserva también dígitos no ASCII (como antes)
+    return _NO_DIGITOS.sub("", unicodedata.normalize("NFKD", numero))
+
+
+# ---------------------------
+# Cuerpo JSON pre-serializado
+# ---------------------------
+class CuerpoJSON:
+    """JSON ya serializado + ETag del contenido + variantes comprimidas."""
+
+    __slots__ = ("raw", "gzip", "br", "etag")
+
+    def __init__(self, obj):
+        self.raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.sha256(self.raw).hexdigest()[:32]
+        self.br = None
+
+        # Si el snapshot ya tiene este mismo contenido (mismo ETag), se usan sus
+        # variantes ya comprimidas en vez de comprimir de nuevo. Se copian a
+        # bytes una vez: WSGI (gunicorn) solo acepta bytes en el cuerpo, no
+        # memoryviews del mmap.
+        previo = _SNAPSHOT.cuerpo(self.etag) if _SNAPSHOT is not None else None
+        if previo is not None:
+            self.raw, self.gzip, self.br = (bytes(v) if v is not None else None for v in previo)
+        else:
+            self.gzip = gzip.compress(self.raw, compresslevel=9, mtime=0)
+        if self.br is None and brotli is not None:
+            self.br = brotli.compress(self.raw, quality=BROTLI_CALIDAD)
+
+
+def _respuesta_binaria(datos):
+    # Lista de un elemento: los bytes ya armados se sirven sin copiarlos
+    resp = Response([datos], mimetype="application/json")
+    resp.headers["Content-Length"] = str(len(datos))
+    return resp
+
+
+# Sufijo del ETag por Content-Encoding: un ETag fuerte identifica bytes
+# exactos, así que cada variante comprimida lleva el suyo
+SUFIJOS_ETAG = {None: "", "gzip": "-gz", "br": "-br"}
+
+
+def respuesta_json(cuerpo, cache_control=CACHE_CONTROL_DATOS, version=None):
+    """
+    Sirve un CuerpoJSON respetando If-None-Match (304) y Accept-Encoding.
+    No vuelve a serializar ni a comprimir nada por request.
+    El ETag es el del contenido más un sufijo por codificación; para el 304
+    vale cualquiera de las variantes (el contenido es el mismo).
+    `version` (hash del CSV de origen) se informa en X-Datos-Version.
+    """
+    aceptadas = request.accept_encodings
+    if cuerpo.br is not None and aceptadas["br"]:
+        codificacion, datos = "br", cuerpo.br
+    elif aceptadas["gzip"]:
+        codificacion, datos = "gzip", cuerpo.gzip
+    else:
+        codificacion, datos = None, cuerpo.raw
+
+    if any(request.if_none_match.contains(cuerpo.etag + sufijo) for sufijo in SUFIJOS_ETAG.values()):
+        resp = Response(status=304)
+    else:
+        resp = _respuesta_binaria(datos)
+        if codificacion:
+            resp.headers["Content-Encoding"] = codificacion
+
+    resp.set_etag(cuerpo.etag + SUFIJOS_ETAG[codificacion])
+    resp.headers["Cache-Control"] = cache_control
+    resp.headers["Vary"] = "Accept-Encoding"
+    if version:
+        resp.headers["X-Datos-Version"] = version
+    return resp
+
+
+# ---------------------------
+# Recarga por mtime
+# ---------------------------
+class RecargadorCSV:
+    """
+    Mantiene la versión vigente de un dataset y la reconstruye cuando cambia
+    el mtime del archivo. La versión nueva se arma completa fuera del lock de
+    lectura y luego se reemplaza la referencia (asignación atómica), así
+    ningún request ve un índice a medio construir. Si la recarga falla se
+    conserva la versión anterior.
+
+    `construir(filas)` recibe las filas como dicts, vengan del CSV o del snapshot.
+    """
+
+    def __init__(self, nombre, path, requeridas, construir):
+        self.nombre = nombre
+        self.path = path
+        self.requeridas = requeridas
+        self.construir = construir
+        self.actual = None
+        self.version = None
+        self.origen = None
+        self.error = None
+        self._mtime = None
+        self._ultima_revision = 0.0
+        self._lock = threading.Lock()
+
+    def _mtime_archivo(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def recargar(self):
+        with self._lock:
+            mtime = self._mtime_archivo()
+            self._ultima_revision = time.monotonic()
+            if mtime is None:
+                self.error = f"No existe el archivo: {self.path}"
+                return False
+            try:
+                version = version_archivo(self.path)
+                snapshot = _SNAPSHOT
+                if snapshot is not None and snapshot.fuentes.get(self.nombre) == version:
+                    _validar_columnas(self.path, snapshot.columnas(self.nombre), self.requeridas)
+                    filas = snapshot.filas(self.nombre)
+                    origen = snapshot.path
+                else:
+                    _, filas = leer_filas_csv(self.path, self.requeridas)
+                    origen = self.path
+                nuevo = self.construir(filas)
+            except Exception as e:
+                self.error = f"Error leyendo {os.path.basename(self.path)}: {str(e)}"
+                log.error("Error cargando dataset", extra={"dataset": self.nombre, "error": self.error})
+                return False
+            self.actual = nuevo
+            self.version = version
+            self.origen = origen
+            self._mtime = mtime
+            self.error = None
+            log.info("Dataset cargado", extra={"dataset": self.nombre, "origen": origen})
+            return True
+
+    def obtener(self):
+        """Versión vigente (o None si nunca se pudo cargar)."""
+        ahora = time.monotonic()
+        if ahora - self._ultima_revision >= INTERVALO_REVISION_MTIME:
+            self._ultima_revision = ahora
+            if self._mtime_archivo() != self._mtime:
+                self.recargar()
+        return self.actual
+
+
+def version_archivo(path):
+    """Hash corto del contenido del archivo (versión del dataset)."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _validar_columnas(path, columnas, requeridas):
+    faltantes = set(requeridas) - set(columnas or [])
+    if faltantes:
+        raise ErrorDatos(f"Faltan columnas en {os.path.basename(path)}: {sorted(faltantes)}")
+
+
+def leer_filas_csv(path, requeridas):
+    """Lee el CSV completo validando columnas. Devuelve (columnas, filas)."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        lector = csv.DictReader(f)
+        _validar_columnas(path, lector.fieldnames, requeridas)
+        # Columnas con nombre (gobernaciones trae columnas vacías sin encabezado)
+        columnas = [c for c in dict.fromkeys(lector.fieldnames) if c]
+        return columnas, list(lector)
+
+
+def _txt(fila, columna):
+    return sys.intern(str(fila.get(columna) or "").strip())
+
+
+# ---------------------------
+# Recintos
+# ---------------------------
+
+# (columna en CSV, clave en JSON)
+RECINTOS_CAMPOS = (
+    ("id_pais", "id_pais"),
+    ("nombre_pais", "nombre_pais"),
+    ("id_departamento", "id_departamento"),
+    ("nombre_departamento", "nombre_departamento"),
+    ("id_provincia", "id_provincia"),
+    ("nombre_provincia", "nombre_provincia"),
+    ("id_municipio", "id_municipio"),
+    ("nombre_municipio", "nombre_municipio"),
+    ("id_recinto", "id_recinto"),
+    ("nombre_recinto", "nombre_recinto"),
+    # extras opcionales (si existen)
+    ("Direccion", "direccion"),
+    ("latitud", "latitud"),
+    ("longitud", "longitud"),
+)
+RECINTOS_REQUERIDAS = {col for col, _ in RECINTOS_CAMPOS[:10]}
+RECINTOS_CLAVES = tuple(clave for _, clave in RECINTOS_CAMPOS)
+
+
+# Jerarquía para la carga perezosa: pais → departamento → provincia → municipio → recinto.
+# El nivel i se filtra por los i primeros ids de RECINTOS_PARAMS.
+RECINTOS_NIVELES = ("paises", "departamentos", "provincias", "municipios", "recintos")
+RECINTOS_PARAMS = ("id_pais", "id_departamento", "id_provincia", "id_municipio")
+
+
+class Recintos:
+    """
+    Filas de recintos como tuplas (orden de RECINTOS_CLAVES) + JSON listo.
+
+    Además del listado completo guarda, por nivel, el JSON de los hijos de
+    cada nodo: niveles["municipios"][(id_pais, id_dep, id_prov)] -> CuerpoJSON
+    """
+
+    __slots__ = ("filas", "cuerpo", "niveles")
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.cuerpo = CuerpoJSON([dict(zip(RECINTOS_CLAVES, fila)) for fila in filas])
+        self.niveles = MappingProxyType(_indexar_niveles(filas))
+
+    def hijos(self, nivel, ids):
+        """CuerpoJSON con los hijos del nodo `ids` (tupla de ids) o None."""
+        return self.niveles.get(nivel, {}).get(tuple(ids))
+
+    def cuerpos(self):
+        yield self.cuerpo
+        for por_padre in self.niveles.values():
+            yield from por_padre.values()
+
+
+def _indexar_niveles(filas):
+    niveles = {}
+    for i, nivel in enumerate(RECINTOS_NIVELES):
+        # Los recintos llevan también dirección y coordenadas
+        columnas = range(2 * i, len(RECINTOS_CLAVES) if nivel == "recintos" else 2 * i + 2)
+        por_padre = {}
+        vistos = set()
+        for fila in filas:
+            padre = tuple(fila[2 * j] for j in range(i))
+            id_hijo = fila[2 * i]
+            if not id_hijo or (padre, id_hijo) in vistos:
+                continue
+            vistos.add((padre, id_hijo))
+            por_padre.setdefault(padre, []).append(
+                {RECINTOS_CLAVES[c]: fila[c] for c in columnas}
+            )
+        niveles[nivel] = MappingProxyType(
+            {padre: CuerpoJSON(hijos) for padre, hijos in por_padre.items()}
+        )
+    return niveles
+
+
+def construir_recintos(filas):
+    return Recintos(tuple(
+        tuple(_txt(fila, col) for col, _ in RECINTOS_CAMPOS)
+        for fila in filas
+    ))
+
+
+RECINTOS = RecargadorCSV("RECINTOS", RECINTOS_CSV_PATH, RECINTOS_REQUERIDAS, construir_recintos)
+
+
+# ---------------------------
+# Candidatos por municipio (alcaldes)
+# ---------------------------
+CANDIDATOS_REQUERIDAS = {
+    "departamento",
+    "provincia",
+    "id_municipio",
+    "municipio",
+    "id_nombre_completo",
+    "nombre_completo",
+    "id_organizacion_politica",
+    "organizacion_politica",
+    "id_cargo",
+    "cargo",
+}
+
+
+class Candidatos:
+    """
+    - by_id_municipio: candidatos por id_municipio
+    - id_by_municipio: ids por nombre de municipio (puede haber nombres repetidos)
+    - alcaldes_by_ubicacion / alcaldes_by_id_municipio: respuesta de /api/candidatos
+      ya filtrada (alcalde), sin duplicados y serializada
+    """
+
+    __slots__ = ("by_id_municipio", "id_by_municipio", "alcaldes_by_ubicacion", "alcaldes_by_id_municipio")
+
+    def __init__(self, by_id_municipio, id_by_municipio, alcaldes_by_ubicacion, alcaldes_by_id_municipio):
+        self.by_id_municipio = MappingProxyType({k: tuple(v) for k, v in by_id_municipio.items()})
+        self.id_by_municipio = MappingProxyType({k: tuple(v) for k, v in id_by_municipio.items()})
+        self.alcaldes_by_ubicacion = MappingProxyType(
+            {k: CuerpoJSON(v) for k, v in alcaldes_by_ubicacion.items()}
+        )
+        self.alcaldes_by_id_municipio = MappingProxyType(
+            {k: CuerpoJSON(v) for k, v in alcaldes_by_id_municipio.items()}
+        )
+
+    def alcaldes(self, departamento, provincia, municipio):
+        return self.alcaldes_by_ubicacion.get((norm(departamento), norm(provincia), norm(municipio)))
+
+    def alcaldes_de_id(self, id_municipio):
+        return self.alcaldes_by_id_municipio.get(str(id_municipio or "").strip())
+
+    def cuerpos(self):
+        yield from self.alcaldes_by_ubicacion.values()
+        yield from self.alcaldes_by_id_municipio.values()
+
+
+def construir_candidatos(filas):
+    by_id_municipio = {}
+    id_by_municipio = {}
+    alcaldes_by_ubicacion = {}
+    alcaldes_by_id_municipio = {}
+    vistos = set()  # (ubicación, nombre, org) para evitar duplicados exactos
+
+    for fila in filas:
+        id_mun = _txt(fila, "id_municipio")
+        mun = sys.intern(norm_mayusculas(fila.get("municipio")))
+        if not id_mun or not mun:
+            continue
+
+        item = {
+            "id_municipio": id_mun,
+            "municipio": mun,
+            "id_nombre_completo": _txt(fila, "id_nombre_completo"),
+            "nombre_completo": _txt(fila, "nombre_completo"),
+            "id_organizacion_politica": _txt(fila, "id_organizacion_politica"),
+            "organizacion_politica": _txt(fila, "organizacion_politica"),
+            "id_cargo": _txt(fila, "id_cargo"),
+            "cargo": _txt(fila, "cargo"),
+        }
+        by_id_municipio.setdefault(id_mun, []).append(item)
+
+        ids = id_by_municipio.setdefault(mun, [])
+        if id_mun not in ids:
+            ids.append(id_mun)
+
+        # Índice para /api/candidatos: solo alcaldes, sin duplicados
+        nombre = item["nombre_completo"]
+        org = item["organizacion_politica"]
+        if not nombre or "alcalde" not in norm(item["cargo"]):
+            continue
+
+        ubicacion = (norm(fila.get("departamento")), norm(fila.get("provincia")), norm(fila.get("municipio")))
+        if (ubicacion, nombre, org) in vistos:
+            continue
+        vistos.add((ubicacion, nombre, org))
+
+        alcalde = {
+            "id_nombre_completo": item["id_nombre_completo"] or nombre,
+            "nombre_completo": nombre,
+            "organizacion_politica": org,
+            "id_organizacion_politica": item["id_organizacion_politica"],
+            "id_cargo": item["id_cargo"],
+            "cargo": item["cargo"],
+        }
+        alcaldes_by_ubicacion.setdefault(ubicacion, []).append(alcalde)
+        alcaldes_by_id_municipio.setdefault(id_mun, []).append(alcalde)
+
+    return Candidatos(by_id_municipio, id_by_municipio, alcaldes_by_ubicacion, alcaldes_by_id_municipio)
+
+
+CANDIDATOS = RecargadorCSV("CANDIDATOS", CANDIDATOS_CSV_PATH, CANDIDATOS_REQUERIDAS, construir_candidatos)
+
+
+# ---------------------------
+# Gobernadores
+# ---------------------------
+GOBERNADORES_REQUERIDAS = {"departamento", "cargo", "nombre_completo", "organizacion_politica"}
+
+
+class Gobernadores:
+    """JSON de gobernadores por departamento normalizado: {"la paz": CuerpoJSON}."""
+
+    __slots__ = ("por_departamento",)
+
+    def __init__(self, por_departamento):
+        self.por_departamento = MappingProxyType(por_departamento)
+
+    def de(self, departamento):
+        return self.por_departamento.get(norm(departamento))
+
+    def cuerpos(self):
+        return self.por_departamento.values()
+
+
+def construir_gobernadores(filas):
+    por_departamento = {}
+    vistos = set()  # evita duplicados
+    for fila in filas:
+        if "gobernador" not in norm(fila.get("cargo")):
+            continue
+        nombre = _txt(fila, "nombre_completo")
+        org = _txt(fila, "organizacion_politica")
+        if not nombre:
+            continue
+        dep = norm(fila.get("departamento"))
+        if (dep, nombre, org) in vistos:
+            continue
+        vistos.add((dep, nombre, org))
+        por_departamento.setdefault(dep, []).append({
+            "nombre_completo": nombre,
+            "organizacion_politica": org,
+        })
+    return Gobernadores({dep: CuerpoJSON(lista) for dep, lista in por_departamento.items()})
+
+
+GOBERNADORES = RecargadorCSV(
+    "GOBERNADORES", GOBERNADORES_CSV_PATH, GOBERNADORES_REQUERIDAS, construir_gobernadores
+)
+
+
+# ---------------------------
+# Registro
+# ---------------------------
+class RegistroDatos:
+    """Todos los datasets de privado/: carga inicial, recarga y versión global."""
+
+    def __init__(self, *datasets):
+        self.datasets = {d.nombre: d for d in datasets}
+
+    def recargar(self):
+        """
+        Recarga todo (al iniciar o desde admin). Primero (re)abre el snapshot
+        compilado, si existe. Devuelve {nombre: ok}.
+        """
+        abrir_snapshot()
+        return {nombre: d.recargar() for nombre, d in self.datasets.items()}
+
+    def version(self):
+        """Hash combinado de las versiones de todos los CSV."""
+        partes = "|".join(f"{nombre}:{d.version}" for nombre, d in sorted(self.datasets.items()))
+        return hashlib.sha256(partes.encode("utf-8")).hexdigest()[:16]
+
+    def estado(self):
+        return {
+            nombre: {
+                "cargado": d.actual is not None,
+                "version": d.version,
+                "origen": d.origen,
+                "error": d.error,
+                "path": d.path,
+            }
+            for nombre, d in self.datasets.items()
+        }
+
+
+REGISTRO = RegistroDatos(RECINTOS, CANDIDATOS, GOBERNADORES)
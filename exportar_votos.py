@@ -0,0 +1,201 @@
+# ---------------------------
+# Exportación masiva de votos (CSV gzip / Parquet)
+# ---------------------------
+"""
+Exporta la tabla de votos para auditorías sin cargarla en memoria:
+
+- Las filas se leen con un cursor del lado del servidor (stream_results +
+  yield_per) como tuplas, nunca como objetos Voto.
+- Se escriben de a un lote: CSV comprimido con gzip incremental, o Parquet
+  con un row group por lote (requiere pyarrow, opcional).
+- En Postgres, la exportación CSV a archivo usa COPY ... TO STDOUT, que
+  evita pasar cada fila por Python.
+
+La memoria usada es constante (un lote), sin importar cuántos votos haya.
+"""
+import csv
+import gzip
+import io
+import os
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+try:
+    import pyarrow as pa  # opcional
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+LOTE = 5000
+FORMATOS = ("csv", "parquet")
+
+
+class ErrorExportacion(Exception):
+    pass
+
+
+def parsear_fecha(valor, fin_de_dia=False):
+    """'YYYY-MM-DD' o ISO completo. Con fin_de_dia una fecha sola incluye todo ese día."""
+    if not valor:
+        return None
+    try:
+        fecha = datetime.fromisoformat(valor)
+    except ValueError:
+        raise ErrorExportacion(f"Fecha inválida: {valor!r} (usar YYYY-MM-DD)")
+    if fin_de_dia and len(valor) == 10:
+        fecha += timedelta(days=1)
+    return fecha
+
+
+def consulta_votos(modelo, desde=None, hasta=None, departamento=None):
+    """SELECT de todas las columnas con los filtros; `hasta` es exclusivo."""
+    columnas = list(modelo.__table__.columns)
+    consulta = select(*columnas).order_by(modelo.__table__.c.id)
+    if desde is not None:
+        consulta = consulta.where(modelo.fecha >= desde)
+    if hasta is not None:
+        consulta = consulta.where(modelo.fecha < hasta)
+    if departamento:
+        consulta = consulta.where(modelo.departamento == departamento)
+    return consulta, [c.name for c in columnas]
+
+
+def _sin_timeouts(session):
+    """
+    En Postgres, levanta para ESTA transacción los timeouts de la conexión
+    (config_db.py): la exportación es una sola sentencia larga (COPY o el
+    cursor) y un cliente lento leyendo el stream no debe cortarla.
+    EXPORTAR_STATEMENT_TIMEOUT_MS permite poner un tope propio (0 = sin tope).
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    limite = int(os.environ.get("EXPORTAR_STATEMENT_TIMEOUT_MS", "0"))
+    session.execute(text(f"SET LOCAL statement_timeout = {limite}"))
+    session.execute(text("SET LOCAL idle_in_transaction_session_timeout = 0"))
+
+
+def _lotes(session, consulta, lote):
+    _sin_timeouts(session)
+    resultado = session.execute(consulta.execution_options(stream_results=True, yield_per=lote))
+    for particion in resultado.partitions():
+        yield particion
+    resultado.close()
+
+
+# ---------------------------
+# Escritores (generadores de bytes)
+# ---------------------------
+def csv_gzip(session, consulta, columnas, lote=LOTE):
+    """Genera el CSV comprimido (gzip) en trozos, uno por lote de filas."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    escritor.writerow(columnas)
+    for filas in _lotes(session, consulta, lote):
+        escritor.writerows(filas)
+        trozo = compresor.compress(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+        if trozo:
+            yield trozo
+    trozo = compresor.compress(buffer.getvalue().encode("utf-8"))
+    yield trozo + compresor.flush()
+
+
+class _Sumidero(io.RawIOBase):
+    """Archivo de solo escritura que acumula bytes hasta que se drenan."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def drenar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _esquema_arrow(consulta):
+    """Tipos Arrow a partir de los de SQLAlchemy (no se infieren del primer lote)."""
+    tipos = []
+    for columna in consulta.selected_columns:
+        python = columna.type.python_type
+        if python is bool:
+            tipo = pa.bool_()
+        elif python is int:
+            tipo = pa.int64()
+        elif python is float:
+            tipo = pa.float64()
+        elif python is datetime:
+            tipo = pa.timestamp("us")
+        else:
+            tipo = pa.string()
+        tipos.append((columna.name, tipo))
+    return pa.schema(tipos)
+
+
+def parquet(session, consulta, columnas, lote=LOTE):
+    """Genera un Parquet en trozos: un row group por lote de filas."""
+    if pq is None:
+        raise ErrorExportacion("Exportar a Parquet requiere pyarrow (pip install pyarrow)")
+
+    esquema = _esquema_arrow(consulta)
+    sumidero = _Sumidero()
+    escritor = pq.ParquetWriter(sumidero, esquema, compression="zstd")
+    for filas in _lotes(session, consulta, lote):
+        escritor.write_table(pa.Table.from_pylist([dict(zip(columnas, f)) for f in filas], schema=esquema))
+        datos = sumidero.drenar()
+        if datos:
+            yield datos
+    escritor.close()
+    yield sumidero.drenar()
+
+
+def generar(formato, session, consulta, columnas, lote=LOTE):
+    if formato == "csv":
+        return csv_gzip(session, consulta, columnas, lote)
+    if formato == "parquet":
+        return parquet(session, consulta, columnas, lote)
+    raise ErrorExportacion(f"Formato inválido: {formato!r} (usar {', '.join(FORMATOS)})")
+
+
+# ---------------------------
+# Exportación a archivo (comando CLI)
+# ---------------------------
+def exportar_a_archivo(formato, session, consulta, columnas, salida, lote=LOTE):
+    """Escribe la exportación en `salida`. Devuelve los bytes escritos."""
+    if formato == "csv" and session.get_bind().dialect.name == "postgresql":
+        return _copy_postgres(session, consulta, salida)
+
+    escritos = 0
+    with open(salida, "wb") as f:
+        for trozo in generar(formato, session, consulta, columnas, lote):
+            f.write(trozo)
+            escritos += len(trozo)
+    return escritos
+
+
+def _copy_postgres(session, consulta, salida):
+    """COPY (SELECT ...) TO STDOUT directo al archivo gzip (sin filas en Python)."""
+    _sin_timeouts(session)  # misma transacción que el COPY
+    conexion = session.connection().connection  # conexión DBAPI (psycopg2)
+    compilada = consulta.compile(dialect=session.get_bind().dialect)
+    with conexion.cursor() as cursor:
+        sql = cursor.mogrify(str(compilada), compilada.params).decode("utf-8")
+        with gzip.open(salida, "wb", compresslevel=6) as f:
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    return os.path.getsize(salida)
@@ -0,0 +1,125 @@
+# ---------------------------
+# Limitador de tasa (token bucket)
+# ---------------------------
+"""
+Token bucket con dos backends intercambiables:
+
+- LimitadorMemoria: por proceso, sin I/O (tests, desarrollo o un solo worker).
+- LimitadorDB: compartido entre todos los workers de gunicorn usando la misma
+  base de datos. Cada intento es un único UPDATE condicional (el recálculo de
+  tokens y el descuento ocurren en la misma sentencia), así dos workers no
+  pueden gastar el mismo token. Los tiempos se guardan como epoch (float)
+  para que la aritmética sea igual en Postgres y SQLite.
+
+`adquirir(clave, capacidad, tasa)` devuelve 0.0 si se concedió el token o
+los segundos que faltan para que haya uno disponible. `devolver(clave,
+capacidad)` reintegra un token adquirido que al final no se usó.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+
+class LimiteExcedido(Exception):
+    """No hay tokens; `espera` = segundos hasta el próximo disponible."""
+
+    def __init__(self, clave, espera):
+        super().__init__(f"Límite de tasa excedido para {clave} (reintentar en {espera:.1f}s)")
+        self.clave = clave
+        self.espera = espera
+
+
+class LimitadorMemoria:
+    def __init__(self, max_claves=100_000):
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()  # clave -> (tokens, actualizado)
+        self._lock = threading.Lock()
+
+    def adquirir(self, clave, capacidad, tasa, costo=1.0):
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, actualizado = self._cubetas.pop(clave, (capacidad, ahora))
+            tokens = min(capacidad, tokens + (ahora - actualizado) * tasa)
+            if tokens >= costo:
+                tokens -= costo
+                espera = 0.0
+            else:
+                espera = (costo - tokens) / tasa
+            self._cubetas[clave] = (tokens, ahora)
+            if len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)  # la menos usada
+            return espera
+
+    def devolver(self, clave, capacidad, costo=1.0):
+        with self._lock:
+            if clave in self._cubetas:
+                tokens, actualizado = self._cubetas[clave]
+                self._cubetas[clave] = (min(capacidad, tokens + costo), actualizado)
+
+
+class LimitadorDB:
+    def __init__(self, db, modelo):
+        """modelo: tabla con columnas clave (PK), tokens (float), actualizado (float epoch)."""
+        self.db = db
+        self.tabla = modelo.__table__
+
+    def adquirir(self, clave, capacidad, tasa, costo=1.0, reintentos=2):
+        t = self.tabla
+        ahora = time.time()
+        recargados = t.c.tokens + (ahora - t.c.actualizado) * tasa
+        disponibles = case((recargados > capacidad, capacidad), else_=recargados)
+
+        # Conexión propia: no mezcla este commit con la sesión del request
+        with self.db.engine.begin() as conn:
+            res = conn.execute(
+                update(t)
+                .where(t.c.clave == clave, disponibles >= costo)
+                .values(tokens=disponibles - costo, actualizado=ahora)
+            )
+            if res.rowcount == 1:
+                return 0.0
+
+            fila = conn.execute(
+                select(t.c.tokens, t.c.actualizado).where(t.c.clave == clave)
+            ).first()
+
+        if fila is None:
+            # Primera vez que se ve esta clave: arranca con la cubeta llena
+            try:
+                with self.db.engine.begin() as conn:
+                    conn.execute(insert(t).values(clave=clave, tokens=capacidad - costo, actualizado=ahora))
+                return 0.0
+            except IntegrityError:
+                # Otro worker la creó a la vez: se reintenta por la vía normal
+                return self.adquirir(clave, capacidad, tasa, costo, reintentos)
+
+        tokens = min(capacidad, fila.tokens + (ahora - fila.actualizado) * tasa)
+        espera = (costo - tokens) / tasa
+        if espera > 0:
+            return espera
+        # La fila cambió entre el UPDATE y el SELECT (otro worker, o el reloj de
+        # otro proceso atrasado): 0.0 significaría "token gastado" sin haberlo
+        # gastado, así que se reintenta el UPDATE y, si no, se pide esperar
+        if reintentos > 0:
+            return self.adquirir(clave, capacidad, tasa, costo, reintentos - 1)
+        return 1.0 / tasa
+
+    def devolver(self, clave, capacidad, costo=1.0):
+        t = self.tabla
+        sumados = t.c.tokens + costo
+        with self.db.engine.begin() as conn:
+            conn.execute(
+                update(t)
+                .where(t.c.clave == clave)
+                .values(tokens=case((sumados > capacidad, capacidad), else_=sumados))
+            )
+
+    def purgar(self, antiguedad_segundos=3600):
+        """Borra cubetas sin uso (ya estarían llenas); devuelve cuántas."""
+        t = self.tabla
+        with self.db.engine.begin() as conn:
+            res = conn.execute(t.delete().where(t.c.actualizado < time.time() - antiguedad_segundos))
+        return res.rowcount
@@ -0,0 +1,129 @@
+# ---------------------------
+# Límite de peticiones por IP y por número
+# ---------------------------
+"""
+Token bucket por IP del cliente y por número de teléfono para las rutas
+que escriben en la base o firman tokens (generar_link, votar, enviar_voto)
+y para /api/*.
+
+Cada regla se configura como "capacidad/segundos" (ráfaga máxima y ventana
+en la que se recupera por completo), p. ej.:
+
+  LIMITE_GENERAR_LINK_IP=20/60      20 pedidos por minuto por IP
+  LIMITE_GENERAR_LINK_NUMERO=5/600  5 enlaces cada 10 minutos por número
+  LIMITE_HTTP_BACKEND=memoria|db    por worker (sin I/O) o compartido en la base
+
+Con "memoria" (por defecto) el rechazo ocurre antes de cualquier consulta a
+Postgres; cada worker lleva su propia cuenta, así que el límite efectivo es
+capacidad x workers. Con "db" el límite es exacto entre workers a costa de
+un UPDATE por pedido (ver limitador.py).
+
+La IP se toma de X-Forwarded-For contando PROXIES_CONFIABLES saltos desde
+la derecha (el primer valor lo escribe el cliente y se puede falsificar).
+"""
+import os
+import threading
+from collections import Counter
+
+# regla -> (defecto por IP, defecto por número); variables LIMITE_<REGLA>_IP / _NUMERO
+#
+# votar y enviar_voto se limitan primero por número (el del token firmado o
+# el de la sesión): detrás de una IP de CGNAT o de una red móvil votan
+# cientos de personas a la vez, y un límite por IP ajustado las dejaría
+# afuera. Sin un token válido la ruta responde antes de tocar la base, así
+# que la IP queda como un tope holgado contra un solo cliente que recorre
+# muchos números; se aplica después del límite por número, en la vista.
+REGLAS = {
+    "generar_link": ("20/60", "5/600"),
+    "votar": ("600/60", "10/600"),
+    "enviar_voto": ("300/60", "5/600"),
+    "api": ("300/60", None),
+}
+NUMERO_PRIMERO = {"votar", "enviar_voto"}
+
+# endpoint de Flask -> regla
+ENDPOINTS = {
+    "generar_link": "generar_link",
+    "votar": "votar",
+    "enviar_voto": "enviar_voto",
+}
+
+
+def _leer_regla(variable, defecto):
+    """'capacidad/segundos' -> (capacidad, tokens por segundo); None si está desactivada."""
+    valor = os.environ.get(variable, defecto or "")
+    if not valor or valor == "0":
+        return None
+    capacidad, segundos = valor.split("/")
+    capacidad = float(capacidad)
+    return capacidad, capacidad / float(segundos)
+
+
+def _sin_puerto(ip):
+    # Azure agrega el puerto: "1.2.3.4:5678" o "[2001:db8::1]:5678"
+    if ip.startswith("["):
+        return ip[1:ip.find("]")] if "]" in ip else ip
+    if ip.count(":") == 1:
+        return ip.split(":", 1)[0]
+    return ip
+
+
+def ip_cliente(request, proxies_confiables=None):
+    if proxies_confiables is None:
+        proxies_confiables = int(os.environ.get("PROXIES_CONFIABLES", "1"))
+    reenviado = request.headers.get("X-Forwarded-For", "")
+    partes = [p.strip() for p in reenviado.split(",") if p.strip()]
+    if partes and proxies_confiables > 0:
+        return _sin_puerto(partes[-min(proxies_confiables, len(partes))])
+    return request.remote_addr or ""
+
+
+class LimiteHTTP:
+    def __init__(self, limitador):
+        self.limitador = limitador
+        self.reglas_ip = {}
+        self.reglas_numero = {}
+        for regla, (defecto_ip, defecto_numero) in REGLAS.items():
+            prefijo = f"LIMITE_{regla.upper()}"
+            self.reglas_ip[regla] = _leer_regla(f"{prefijo}_IP", defecto_ip)
+            self.reglas_numero[regla] = _leer_regla(f"{prefijo}_NUMERO", defecto_numero)
+        self.rechazos = Counter()
+        self._lock = threading.Lock()  # los hilos del worker comparten los contadores
+
+    def regla_de(self, endpoint):
+        if endpoint in ENDPOINTS:
+            return ENDPOINTS[endpoint]
+        if endpoint and endpoint.startswith("api_"):
+            return "api"
+        return None
+
+    def numero_primero(self, regla):
+        """True si la regla se limita por número antes que por IP (ver REGLAS)."""
+        return regla in NUMERO_PRIMERO
+
+    def _consumir(self, regla, tipo, valor, limite):
+        """Segundos a esperar (0.0 si pasa)."""
+        if limite is None or not valor:
+            return 0.0
+        capacidad, tasa = limite
+        espera = self.limitador.adquirir(f"http:{regla}:{tipo}:{valor}", capacidad, tasa)
+        if espera > 0:
+            with self._lock:
+                self.rechazos[f"{regla}:{tipo}"] += 1
+        return espera
+
+    def por_ip(self, regla, ip):
+        return self._consumir(regla, "ip", ip, self.reglas_ip.get(regla))
+
+    def por_numero(self, regla, numero):
+        return self._consumir(regla, "numero", numero, self.reglas_numero.get(regla))
+
+    def estadisticas(self):
+        with self._lock:
+            rechazos = dict(self.rechazos)
+        return {
+            "backend": type(self.limitador).__name__,
+            "reglas_ip": self.reglas_ip,
+            "reglas_numero": self.reglas_numero,
+            "rechazos": rechazos,
+        }
@@ -0,0 +1,207 @@
+# ---------------------------
+# Logs estructurados (JSON) sin bloquear los requests
+# ---------------------------
+"""
+Configura el logging del proceso para que ningún hilo de request (ni de las
+colas) escriba en stdout:
+
+  - el logger raíz tiene un solo handler, un QueueHandler: emitir un
+    registro es formatear el mensaje y un put_nowait() en una cola en
+    memoria. Si la cola se llena (stdout trabado), el registro se descarta
+    y se cuenta (descartados()) en vez de frenar al worker;
+  - un QueueListener (un hilo por proceso) saca los registros de la cola y
+    los escribe, una línea JSON por evento (LOG_FORMATO=texto para
+    desarrollo local).
+
+Cada línea lleva ts, nivel, logger, mensaje, pid e hilo, los campos del
+contexto actual (request_id, endpoint, elemento de cola...; ver
+contexto_log) y los que se pasan con extra={...}.
+
+Variables de entorno:
+  LOG_NIVEL              nivel de los loggers "votaciones.*" (default INFO)
+  LOG_NIVEL_LIBRERIAS    nivel del resto: SQLAlchemy, werkzeug... (default WARNING)
+  LOG_FORMATO            json | texto (default json)
+  LOG_SALIDA             stdout | stderr (default stdout)
+  LOG_COLA_MAX           registros en espera antes de descartar (default 10000)
+  LOG_MUESTREO_PAYLOADS  fracción de payloads que se vuelcan en DEBUG (default 0.01)
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOGGER_APP = "votaciones"
+MUESTREO_PAYLOADS = float(os.environ.get("LOG_MUESTREO_PAYLOADS", "0.01"))
+
+# Campos del contexto actual (request o elemento de cola); se copian al
+# registro en el hilo que lo emite, antes de encolarlo
+_contexto = contextvars.ContextVar("contexto_log", default={})
+
+# Atributos propios de LogRecord: lo demás vino por extra={...}
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "contexto"}
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+# ---------------------------
+# Contexto (request_id, elemento de cola...)
+# ---------------------------
+def abrir_contexto(**campos):
+    """Agrega campos al contexto actual. Devuelve el token para cerrar_contexto()."""
+    return _contexto.set({**_contexto.get(), **campos})
+
+
+def cerrar_contexto(token):
+    _contexto.reset(token)
+
+
+@contextlib.contextmanager
+def contexto_log(**campos):
+    token = abrir_contexto(**campos)
+    try:
+        yield
+    finally:
+        cerrar_contexto(token)
+
+
+def muestrear(tasa=MUESTREO_PAYLOADS):
+    """True para una fracción `tasa` de las llamadas (volcados de payloads)."""
+    return tasa >= 1 or (tasa > 0 and random.random() < tasa)
+
+
+# ---------------------------
+# Formatos
+# ---------------------------
+def campos_registro(record):
+    """Contexto + extras del registro (lo que no es atributo estándar de LogRecord)."""
+    campos = dict(getattr(record, "contexto", None) or {})
+    for clave, valor in vars(record).items():
+        if clave not in _ATRIBUTOS_RECORD:
+            campos[clave] = valor
+    return campos
+
+
+class FormateadorJSON(logging.Formatter):
+    def format(self, record):
+        linea = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            "pid": record.process,
+            "hilo": record.threadName,
+        }
+        linea.update(campos_registro(record))
+        if record.exc_text:
+            linea["excepcion"] = record.exc_text
+        return json.dumps(linea, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class FormateadorTexto(logging.Formatter):
+    """Para leer en una terminal: 'hora NIVEL logger: mensaje clave=valor ...'."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        texto = super().format(record)
+        campos = " ".join(f"{k}={v}" for k, v in campos_registro(record).items())
+        if campos:
+            texto = texto.split("\n", 1)
+            texto[0] = f"{texto[0]} {campos}"
+            texto = "\n".join(texto)
+        return texto
+
+
+# ---------------------------
+# Handler con cola
+# ---------------------------
+class HandlerCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca espera: si la cola está llena, descarta y cuenta.
+    El registro se prepara en el hilo que lo emite (mensaje ya interpolado,
+    traceback como texto, contexto copiado) para que el listener no toque
+    objetos que el request sigue modificando.
+    """
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.contexto = _contexto.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+def configurar_logs():
+    """Instala el handler con cola en el logger raíz (una vez por proceso)."""
+    global _handler, _listener
+    with _lock:
+        if _handler is not None:
+            return
+        salida = sys.stderr if os.environ.get("LOG_SALIDA", "stdout") == "stderr" else sys.stdout
+        escritor = logging.StreamHandler(salida)
+        if os.environ.get("LOG_FORMATO", "json") == "texto":
+            escritor.setFormatter(FormateadorTexto())
+        else:
+            escritor.setFormatter(FormateadorJSON())
+
+        cola = queue.Queue(maxsize=int(os.environ.get("LOG_COLA_MAX", "10000")))
+        _handler = HandlerCola(cola)
+        _listener = logging.handlers.QueueListener(cola, escritor, respect_handler_level=True)
+
+        raiz = logging.getLogger()
+        for h in list(raiz.handlers):
+            raiz.removeHandler(h)
+        raiz.addHandler(_handler)
+        raiz.setLevel(os.environ.get("LOG_NIVEL_LIBRERIAS", "WARNING").upper())
+        logging.getLogger(LOGGER_APP).setLevel(os.environ.get("LOG_NIVEL", "INFO").upper())
+
+        _listener.start()
+        # Tras un fork (gunicorn --preload) el hilo del listener no existe en
+        # el hijo, y la cola heredada pudo quedar con su lock tomado
+        os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+        atexit.register(_detener)
+
+
+def _reiniciar_en_hijo():
+    cola = queue.Queue(maxsize=_handler.queue.maxsize)
+    _handler.queue = cola
+    _listener.queue = cola
+    _listener._thread = None
+    _listener.start()
+
+
+def _detener():
+    """Al salir: escribe lo que quedó en la cola."""
+    try:
+        _listener.stop()
+    except (queue.Full, AttributeError):
+        pass
+
+
+def descartados():
+    """Registros descartados en este proceso por cola llena."""
+    return _handler.descartados if _handler is not None else 0
@@ -0,0 +1,273 @@
+# ---------------------------
+# Métricas en formato Prometheus (sumadas entre workers)
+# ---------------------------
+"""
+Registro de métricas por proceso (contadores, gauges e histogramas con
+buckets fijos) y su exposición en el formato de texto de Prometheus.
+
+Con gunicorn cada worker tiene su propio registro en memoria. Para que
+/metrics muestre el total sin importar qué worker atiende el scrape, cada
+proceso vuelca su registro como JSON a un directorio compartido cada pocos
+segundos (tarea periódica) y al atender /metrics; el que responde suma los
+archivos de todos:
+
+  - contadores e histogramas se suman;
+  - los gauges se informan por pid y solo de los archivos recientes;
+  - el archivo de un worker que ya murió se borra (gunicorn los recicla):
+    sus contadores dejan de sumarse y el total baja, lo que Prometheus
+    trata como un reinicio de contador en rate()/increase().
+
+El directorio es METRICAS_DIR o, por defecto, uno temporal por proceso
+maestro de gunicorn (así un reinicio empieza de cero). Sin dependencias:
+no requiere prometheus_client.
+"""
+import atexit
+import contextlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+log = logging.getLogger("votaciones.metricas")
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+CONTADOR = "counter"
+GAUGE = "gauge"
+HISTOGRAMA = "histogram"
+
+
+def _clave(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _escapar(valor):
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas_texto(pares):
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError, ValueError, OverflowError):
+        return True  # existe pero es de otro usuario, o pid ilegible: no se borra
+    return True
+
+
+def _numero(valor):
+    if isinstance(valor, float):
+        if math.isinf(valor):
+            return "+Inf" if valor > 0 else "-Inf"
+        return repr(valor)
+    return str(valor)
+
+
+class Metricas:
+    def __init__(self, directorio=None, vigencia_gauges=60.0):
+        self._lock = threading.Lock()
+        self._definiciones = {}  # nombre -> (tipo, ayuda, buckets)
+        self._valores = {}       # nombre -> {clave de etiquetas: valor | [cuentas, suma, n]}
+        self._recolectores = []
+        self._directorio_config = directorio
+        self._directorio = directorio
+        self.vigencia_gauges = vigencia_gauges
+        self._archivo = None
+        # Tras un fork (gunicorn --preload) el hijo no hereda las cuentas del padre
+        os.register_at_fork(after_in_child=self._reiniciar)
+        atexit.register(self._volcar_al_salir)
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._directorio = self._directorio_config
+        for serie in self._valores.values():
+            serie.clear()
+
+    # ---------------------------
+    # Definición
+    # ---------------------------
+    def contador(self, nombre, ayuda):
+        self._definir(nombre, CONTADOR, ayuda)
+
+    def gauge(self, nombre, ayuda):
+        self._definir(nombre, GAUGE, ayuda)
+
+    def histograma(self, nombre, ayuda, buckets=BUCKETS_SEGUNDOS):
+        self._definir(nombre, HISTOGRAMA, ayuda, tuple(buckets))
+
+    def _definir(self, nombre, tipo, ayuda, buckets=None):
+        with self._lock:
+            self._definiciones[nombre] = (tipo, ayuda, buckets)
+            self._valores.setdefault(nombre, {})
+
+    def recolector(self, funcion):
+        """funcion(metricas) se llama antes de cada volcado (p. ej. para copiar estadísticas de un cache)."""
+        self._recolectores.append(funcion)
+        return funcion
+
+    # ---------------------------
+    # Registro
+    # ---------------------------
+    def sumar(self, nombre, valor=1, **etiquetas):
+        clave = _clave(etiquetas)
+        with self._lock:
+            serie = self._valores[nombre]
+            serie[clave] = serie.get(clave, 0) + valor
+
+    def fijar(self, nombre, valor, **etiquetas):
+        """Gauge, o contador cuyo total acumulado ya lleva otro objeto."""
+        clave = _clave(etiquetas)
+        with self._lock:
+            self._valores[nombre][clave] = valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = self._definiciones[nombre][2]
+        indice = len(buckets)
+        for i, limite in enumerate(buckets):
+            if valor <= limite:
+                indice = i
+                break
+        clave = _clave(etiquetas)
+        with self._lock:
+            serie = self._valores[nombre]
+            actual = serie.get(clave)
+            if actual is None:
+                actual = serie[clave] = [[0] * (len(buckets) + 1), 0.0, 0]
+            actual[0][indice] += 1
+            actual[1] += valor
+            actual[2] += 1
+
+    # ---------------------------
+    # Volcado a disco
+    # ---------------------------
+    def directorio(self):
+        if self._directorio is None:
+            self._directorio = os.environ.get("METRICAS_DIR") or os.path.join(
+                tempfile.gettempdir(), f"metricas_votaciones_{os.getppid()}"
+            )
+        return self._directorio
+
+    def _instantanea(self):
+        for funcion in self._recolectores:
+            try:
+                funcion(self)
+            except Exception as e:
+                log.warning("Error en recolector de métricas", extra={"error": str(e)})
+        with self._lock:
+            return {
+                nombre: {
+                    "tipo": tipo,
+                    "ayuda": ayuda,
+                    "buckets": buckets,
+                    "series": [
+                        [list(clave), [list(v[0]), v[1], v[2]] if tipo == HISTOGRAMA else v]
+                        for clave, v in self._valores[nombre].items()
+                    ],
+                }
+                for nombre, (tipo, ayuda, buckets) in self._definiciones.items()
+            }
+
+    def volcar(self):
+        """Escribe el registro de este proceso (atómico: archivo temporal + rename)."""
+        instantanea = self._instantanea()
+        directorio = self.directorio()
+        os.makedirs(directorio, exist_ok=True)
+        if self._archivo is None:
+            self._archivo = os.path.join(directorio, f"{os.getpid()}-{time.time_ns()}.json")
+        temporal = self._archivo + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "metricas": instantanea}, f, separators=(",", ":"))
+        os.replace(temporal, self._archivo)
+        return instantanea
+
+    def _volcar_al_salir(self):
+        # Solo si el proceso ya participaba (no los comandos CLI que importan la app)
+        if self._archivo is None:
+            return
+        try:
+            self.volcar()
+        except Exception:
+            pass
+
+    # ---------------------------
+    # Exposición
+    # ---------------------------
+    def _leer_procesos(self):
+        """[(pid, instantanea, vigente)] de todos los procesos, incluido este."""
+        propia = self.volcar()
+        procesos = [(os.getpid(), propia, True)]
+        limite = time.time() - self.vigencia_gauges
+        for nombre in os.listdir(self.directorio()):
+            path = os.path.join(self.directorio(), nombre)
+            if not nombre.endswith(".json") or path == self._archivo:
+                continue
+            try:
+                vigente = os.stat(path).st_mtime >= limite
+                with open(path, encoding="utf-8") as f:
+                    datos = json.load(f)
+            except (OSError, ValueError):
+                continue  # un worker lo está reemplazando o murió a mitad
+            pid = datos.get("pid")
+            if not _proceso_vivo(pid):
+                with contextlib.suppress(OSError):
+                    os.remove(path)  # worker muerto
+                continue
+            procesos.append((pid, datos.get("metricas") or {}, vigente))
+        return procesos
+
+    def exponer(self):
+        """Texto para Prometheus con la suma de todos los workers."""
+        total = {}
+        for pid, instantanea, vigente in self._leer_procesos():
+            for nombre, metrica in instantanea.items():
+                tipo = metrica["tipo"]
+                if tipo == GAUGE and not vigente:
+                    continue
+                destino = total.setdefault(nombre, {
+                    "tipo": tipo, "ayuda": metrica["ayuda"], "buckets": metrica["buckets"], "series": {},
+                })
+                for clave, valor in metrica["series"]:
+                    clave = tuple(tuple(par) for par in clave)
+                    if tipo == GAUGE:
+                        destino["series"][clave + (("pid", str(pid)),)] = valor
+                    elif tipo == HISTOGRAMA:
+                        actual = destino["series"].get(clave)
+                        if actual is None or len(actual[0]) != len(valor[0]):
+                            destino["series"][clave] = [list(valor[0]), valor[1], valor[2]]
+                        else:
+                            actual[0] = [a + b for a, b in zip(actual[0], valor[0])]
+                            actual[1] += valor[1]
+                            actual[2] += valor[2]
+                    else:
+                        destino["series"][clave] = destino["series"].get(clave, 0) + valor
+
+        lineas = []
+        for nombre in sorted(total):
+            metrica = total[nombre]
+            lineas.append(f"# HELP {nombre} {metrica['ayuda']}")
+            lineas.append(f"# TYPE {nombre} {metrica['tipo']}")
+            for clave in sorted(metrica["series"]):
+                valor = metrica["series"][clave]
+                if metrica["tipo"] != HISTOGRAMA:
+                    lineas.append(f"{nombre}{_etiquetas_texto(clave)} {_numero(valor)}")
+                    continue
+                cuentas, suma, n = valor
+                acumulado = 0
+                for limite, cuenta in zip(list(metrica["buckets"]) + [math.inf], cuentas):
+                    acumulado += cuenta
+                    pares = clave + (("le", _numero(float(limite))),)
+                    lineas.append(f"{nombre}_bucket{_etiquetas_texto(pares)} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas_texto(clave)} {_numero(float(suma))}")
+                lineas.append(f"{nombre}_count{_etiquetas_texto(clave)} {n}")
+        return "\n".join(lineas) + "\n"
@@ -0,0 +1,75 @@
+"""Índices de votos para auditoría y análisis
+
+Revision ID: a1c3e5f70001
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+Las tablas se crean con db.create_all() al arrancar; esta migración solo
+agrega los índices a bases que ya existían (if_not_exists: en una base
+nueva create_all ya los creó). En Postgres se crean CONCURRENTLY para no
+bloquear los INSERT de votos mientras se construyen, sin statement_timeout,
+y si un intento anterior dejó un índice INVALID se borra y se reconstruye.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "a1c3e5f70001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDICES = (
+    ("ix_votos_ip_fecha", ["ip", "fecha"], None),
+    ("ix_votos_fecha", ["fecha"], None),
+    ("ix_votos_departamento_fecha", ["departamento", "fecha"], None),
+    ("ix_votos_id_municipio_candidato", ["id_municipio", "candidato"], None),
+    ("ix_votos_latitud_longitud", ["latitud", "longitud"], "latitud IS NOT NULL"),
+)
+
+
+def _concurrente():
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def _borrar_si_invalido(nombre, tabla):
+    """
+    Un CREATE INDEX CONCURRENTLY cancelado deja el índice INVALID (existe
+    pero no se usa); if_not_exists lo saltaría y la migración "funcionaría".
+    """
+    invalido = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :nombre AND pg_table_is_visible(c.oid) AND NOT i.indisvalid"
+    ), {"nombre": nombre}).first()
+    if invalido:
+        op.drop_index(nombre, table_name=tabla, postgresql_concurrently=True)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        if _concurrente():
+            # env.py usa el engine de la app, con statement_timeout de 15 s
+            # (config_db.py): construir el índice en una tabla grande tarda más
+            op.execute("SET statement_timeout = 0")
+        try:
+            for nombre, columnas, where in INDICES:
+                if _concurrente():
+                    _borrar_si_invalido(nombre, "votos")
+                op.create_index(
+                    nombre, "votos", columnas,
+                    if_not_exists=True,
+                    postgresql_concurrently=_concurrente(),
+                    postgresql_where=sa.text(where) if where else None,
+                    sqlite_where=sa.text(where) if where else None,
+                )
+        finally:
+            if _concurrente():
+                op.execute("RESET statement_timeout")  # la conexión vuelve al pool
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for nombre, _, _ in reversed(INDICES):
+            op.drop_index(nombre, table_name="votos", if_exists=True,
+                          postgresql_concurrently=_concurrente())
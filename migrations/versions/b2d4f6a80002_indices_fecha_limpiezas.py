@@ -0,0 +1,60 @@
+"""Índices por fecha para las limpiezas periódicas
+
+Revision ID: b2d4f6a80002
+Revises: a1c3e5f70001
+Create Date: 2026-10-18 13:00:00
+
+El barrido de numeros_temporales y la retención de
+whatsapp_mensajes_procesados filtran por fecha; sin índice cada lote sería
+un recorrido completo de la tabla.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "b2d4f6a80002"
+down_revision = "a1c3e5f70001"
+branch_labels = None
+depends_on = None
+
+
+INDICES = (
+    ("ix_numeros_temporales_fecha", "numeros_temporales", ["fecha"]),
+    ("ix_whatsapp_mensajes_procesados_fecha", "whatsapp_mensajes_procesados", ["fecha"]),
+)
+
+
+def _concurrente():
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def _borrar_si_invalido(nombre, tabla):
+    """Un CREATE INDEX CONCURRENTLY cancelado deja el índice INVALID (ver a1c3e5f70001)."""
+    invalido = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :nombre AND pg_table_is_visible(c.oid) AND NOT i.indisvalid"
+    ), {"nombre": nombre}).first()
+    if invalido:
+        op.drop_index(nombre, table_name=tabla, postgresql_concurrently=True)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        if _concurrente():
+            op.execute("SET statement_timeout = 0")  # timeout de la app (config_db.py)
+        try:
+            for nombre, tabla, columnas in INDICES:
+                if _concurrente():
+                    _borrar_si_invalido(nombre, tabla)
+                op.create_index(nombre, tabla, columnas, if_not_exists=True,
+                                postgresql_concurrently=_concurrente())
+        finally:
+            if _concurrente():
+                op.execute("RESET statement_timeout")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for nombre, tabla, _ in reversed(INDICES):
+            op.drop_index(nombre, table_name=tabla, if_exists=True,
+                          postgresql_concurrently=_concurrente())
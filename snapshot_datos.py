@@ -0,0 +1,185 @@
+# ---------------------------
+# Snapshot binario de los datos de referencia
+# ---------------------------
+"""
+Compila los CSV de privado/ en un único archivo binario que se abre con mmap,
+para que cada worker de gunicorn arranque sin parsear CSV ni recomprimir JSON
+y las páginas del archivo se compartan entre procesos (page cache).
+
+Formato (orden de bytes nativo, indicado en la cabecera):
+  b"VOTSNAP1" | uint32 largo_cabecera | cabecera JSON | relleno a 8 | datos
+Secciones dentro de datos (offsets relativos al inicio de datos):
+  - cadenas: tabla de offsets uint32 (n + 1) + bytes utf-8 de cada cadena única
+  - tablas: por CSV, una columna = arreglo uint32 de índices de cadena (columnar)
+  - cuerpos: JSON pre-serializado + gzip + brotli, indexados por ETag
+La cabecera guarda la versión (hash) de cada CSV de origen; si no coincide con
+el CSV actual, ese dataset se lee del CSV (el snapshot está viejo).
+
+Paso de build:  python snapshot_datos.py [ruta_salida]
+"""
+import array
+import json
+import mmap
+import os
+import sys
+
+MAGICO = b"VOTSNAP1"
+FORMATO = 1
+
+
+def _alinear(n, a=8):
+    return (n + a - 1) // a * a
+
+
+class Snapshot:
+    """Lectura de un snapshot vía mmap (no copia nada hasta que se pide)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mv = memoryview(self._mm)
+
+        if bytes(mv[:8]) != MAGICO:
+            raise ValueError(f"Snapshot inválido: {path}")
+        largo = int.from_bytes(mv[8:12], "little")
+        cabecera = json.loads(bytes(mv[12:12 + largo]).decode("utf-8"))
+        if cabecera.get("formato") != FORMATO or cabecera.get("byteorder") != sys.byteorder:
+            raise ValueError(f"Snapshot con formato incompatible: {path}")
+
+        base = _alinear(12 + largo)
+        self.path = path
+        self.fuentes = cabecera["fuentes"]  # {nombre: version del CSV}
+        self._mv = mv[base:]
+        self._tablas = cabecera["tablas"]
+        self._cuerpos = cabecera["cuerpos"]
+
+        cad = cabecera["cadenas"]
+        self._offsets = self._mv[cad["offsets"]:cad["offsets"] + 4 * (cad["n"] + 1)].cast("I")
+        self._inicio_cadenas = cad["datos"]
+        self._cadenas = [None] * cad["n"]
+
+    def cadena(self, i):
+        s = self._cadenas[i]
+        if s is None:
+            ini = self._inicio_cadenas + self._offsets[i]
+            fin = self._inicio_cadenas + self._offsets[i + 1]
+            s = self._cadenas[i] = sys.intern(str(self._mv[ini:fin], "utf-8"))
+        return s
+
+    def columnas(self, nombre):
+        return self._tablas[nombre]["columnas"]
+
+    def filas(self, nombre):
+        """Filas del CSV original como dicts {columna: valor}."""
+        tabla = self._tablas[nombre]
+        n = tabla["filas"]
+        columnas = tabla["columnas"]
+        arreglos = [self._mv[off:off + 4 * n].cast("I") for off in tabla["offsets"]]
+        cadena = self.cadena
+        for r in range(n):
+            yield {col: cadena(arr[r]) for col, arr in zip(columnas, arreglos)}
+
+    def cuerpo(self, etag):
+        """(raw, gzip, br) como memoryviews del mmap, o None si no está."""
+        entrada = self._cuerpos.get(etag)
+        if entrada is None:
+            return None
+        raw_off, raw_len, gz_off, gz_len, br_off, br_len = entrada
+        mv = self._mv
+        return (
+            mv[raw_off:raw_off + raw_len],
+            mv[gz_off:gz_off + gz_len],
+            mv[br_off:br_off + br_len] if br_len else None,
+        )
+
+
+def escribir_snapshot(path, fuentes, tablas, cuerpos):
+    """
+    fuentes: {nombre: version}
+    tablas:  {nombre: (columnas, filas)}  filas = lista de dicts
+    cuerpos: iterable de CuerpoJSON
+    Se escribe a un temporal y se renombra: los workers que tengan abierto el
+    snapshot anterior lo siguen viendo completo.
+    """
+    datos = bytearray()
+
+    def agregar(b):
+        off = len(datos)
+        datos.extend(b)
+        datos.extend(b"\0" * (_alinear(len(datos)) - len(datos)))
+        return off
+
+    # Cadenas internadas: cada valor distinto se guarda una sola vez
+    indices = {}
+    for columnas, filas in tablas.values():
+        for fila in filas:
+            for col in columnas:
+                indices.setdefault(fila.get(col) or "", len(indices))
+    codificadas = [s.encode("utf-8") for s in indices]
+    offsets = array.array("I", [0])
+    for b in codificadas:
+        offsets.append(offsets[-1] + len(b))
+    cab_cadenas = {"n": len(codificadas), "offsets": agregar(offsets.tobytes())}
+    cab_cadenas["datos"] = agregar(b"".join(codificadas))
+
+    cab_tablas = {}
+    for nombre, (columnas, filas) in tablas.items():
+        cab_tablas[nombre] = {
+            "columnas": list(columnas),
+            "filas": len(filas),
+            "offsets": [
+                agregar(array.array("I", (indices[fila.get(col) or ""] for fila in filas)).tobytes())
+                for col in columnas
+            ],
+        }
+
+    cab_cuerpos = {}
+    for c in cuerpos:
+        if c.etag in cab_cuerpos:
+            continue
+        br = bytes(c.br) if c.br is not None else b""
+        cab_cuerpos[c.etag] = [
+            agregar(bytes(c.raw)), len(c.raw),
+            agregar(bytes(c.gzip)), len(c.gzip),
+            agregar(br) if br else 0, len(br),
+        ]
+
+    cabecera = json.dumps({
+        "formato": FORMATO,
+        "byteorder": sys.byteorder,
+        "fuentes": fuentes,
+        "cadenas": cab_cadenas,
+        "tablas": cab_tablas,
+        "cuerpos": cab_cuerpos,
+    }, separators=(",", ":")).encode("utf-8")
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGICO)
+        f.write(len(cabecera).to_bytes(4, "little"))
+        f.write(cabecera)
+        f.write(b"\0" * (_alinear(12 + len(cabecera)) - 12 - len(cabecera)))
+        f.write(datos)
+    os.replace(tmp, path)
+
+
+def compilar(path=None):
+    """Lee los CSV (nunca el snapshot viejo) y escribe el snapshot nuevo."""
+    import datos_referencia as dr
+
+    path = path or dr.SNAPSHOT_PATH
+    fuentes, tablas, cuerpos = {}, {}, []
+    for nombre, ds in dr.REGISTRO.datasets.items():
+        version = dr.version_archivo(ds.path)
+        columnas, filas = dr.leer_filas_csv(ds.path, ds.requeridas)
+        fuentes[nombre] = version
+        tablas[nombre] = (columnas, filas)
+        cuerpos.extend(ds.construir(filas).cuerpos())
+
+    escribir_snapshot(path, fuentes, tablas, cuerpos)
+    print(f"✅ Snapshot escrito en {path} ({os.path.getsize(path)} bytes, {len(cuerpos)} cuerpos JSON)")
+    return path
+
+
+if __name__ == "__main__":
+    compilar(sys.argv[1] if len(sys.argv) > 1 else None)
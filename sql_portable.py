@@ -0,0 +1,122 @@
+# ---------------------------
+# Sentencias SQL portables (Postgres en producción, SQLite en local)
+# ---------------------------
+"""
+Ayudas para operaciones que SQLAlchemy no expresa igual en todos los
+dialectos: INSERT ... ON CONFLICT DO NOTHING (con RETURNING), insertar y
+encadenar más sentencias en un solo viaje, contadores con
+ON CONFLICT DO UPDATE y borrados por lotes.
+"""
+from sqlalchemy import delete, exists, literal, select, true, union_all
+from sqlalchemy.exc import IntegrityError
+
+
+def _insert_dialecto(session):
+    nombre = session.get_bind().dialect.name
+    if nombre == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if nombre == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def _insert_ignorando(insert, tabla, columnas_conflicto, valores):
+    pk = tabla.primary_key.columns.values()[0]
+    return (insert(tabla).values(**valores)
+            .on_conflict_do_nothing(index_elements=columnas_conflicto)
+            .returning(pk))
+
+
+def insertar_si_no_existe(session, modelo, columnas_conflicto, **valores):
+    """
+    INSERT ... ON CONFLICT (columnas_conflicto) DO NOTHING RETURNING pk dentro
+    de la transacción de la sesión. Devuelve la PK insertada, o None si ya
+    existía. Con otros dialectos se usa un SAVEPOINT y se captura el
+    IntegrityError (devuelve True en vez de la PK).
+    """
+    tabla = modelo.__table__
+    insert = _insert_dialecto(session)
+    if insert is not None:
+        return session.execute(_insert_ignorando(insert, tabla, columnas_conflicto, valores)).scalar()
+
+    try:
+        with session.begin_nested():
+            session.execute(tabla.insert().values(**valores))
+        return True
+    except IntegrityError:
+        return None
+
+
+def insertar_si_no_existe_y_luego(session, modelo, columnas_conflicto, valores, dependientes):
+    """
+    Inserta (ON CONFLICT DO NOTHING) y, solo si se insertó, ejecuta las
+    sentencias `dependientes` en la misma transacción. Cada dependiente es
+    una función condicion -> sentencia DML (UPDATE/DELETE/INSERT) que debe
+    incluir `condicion` en su WHERE.
+    En Postgres todo va en UNA sentencia (CTEs que modifican datos), o sea
+    un solo viaje a la base; en el resto son sentencias sucesivas. No hace
+    commit. Devuelve la PK insertada o None si ya existía.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        nuevo = _insert_ignorando(insert, modelo.__table__, columnas_conflicto, valores).cte("nuevo")
+        insertado = exists(select(nuevo.c[0]))
+        consulta = select(nuevo.c[0])
+        for i, dependiente in enumerate(dependientes):
+            consulta = consulta.add_cte(dependiente(insertado).cte(f"dependiente_{i}"))
+        return session.execute(consulta).scalar()
+
+    pk = insertar_si_no_existe(session, modelo, columnas_conflicto, **valores)
+    if pk is not None:
+        for dependiente in dependientes:
+            session.execute(dependiente(true()))
+    return pk
+
+
+def sumar_en_conflicto(session, modelo, filas, columnas_clave, columna_suma, condicion=None):
+    """
+    Sentencia (sin ejecutar) que inserta `filas` (lista de dicts, con
+    `columna_suma` incluida) y, si la clave ya existe, suma en vez de
+    insertar: INSERT ... SELECT FROM (filas) WHERE condicion
+    ON CONFLICT (clave) DO UPDATE SET suma = suma + excluded.suma.
+    Solo Postgres y SQLite.
+    """
+    tabla = modelo.__table__
+    insert = _insert_dialecto(session)
+    if insert is None:
+        raise NotImplementedError(f"sumar_en_conflicto no soporta {session.get_bind().dialect.name}")
+
+    # UNION ALL de SELECTs de literales (SQLite no acepta alias de columnas en VALUES)
+    nombres = list(filas[0])
+    filas_sql = union_all(*(
+        select(*(literal(f[n], tabla.c[n].type).label(n) for n in nombres)) for f in filas
+    )).subquery("filas")
+    origen = select(*filas_sql.c).where(true() if condicion is None else condicion)
+    sentencia = insert(tabla).from_select(nombres, origen)
+    return sentencia.on_conflict_do_update(
+        index_elements=columnas_clave,
+        set_={columna_suma: tabla.c[columna_suma] + sentencia.excluded[columna_suma]},
+    )
+
+
+def borrar_en_lotes(session, modelo, condicion, lote=1000):
+    """
+    Borra las filas que cumplen `condicion` de a `lote` por transacción, para
+    no bloquear la tabla ni inflar el WAL con un único DELETE gigante.
+    El DELETE vuelve a evaluar `condicion`: una fila que cambió entre el
+    SELECT y el DELETE (p. ej. se renovó) no se borra.
+    Devuelve cuántas filas se borraron.
+    """
+    pk = modelo.__table__.primary_key.columns.values()[0]
+    total = 0
+    while True:
+        ids = session.execute(select(pk).where(condicion).limit(lote)).scalars().all()
+        if not ids:
+            return total
+        res = session.execute(delete(modelo.__table__).where(pk.in_(ids), condicion))
+        session.commit()
+        total += res.rowcount
+        if len(ids) < lote:
+            return total
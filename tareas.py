@@ -0,0 +1,99 @@
+# ---------------------------
+# Tareas periódicas en proceso (limpiezas)
+# ---------------------------
+"""
+Ejecuta funciones de mantenimiento cada N segundos en un hilo daemon por
+proceso (como las colas de WhatsApp: con gunicorn cada worker arranca el
+suyo tras el fork). Las tareas tienen que ser idempotentes y trabajar por
+lotes cortos: si corren en varios workers a la vez, solo se reparten el
+trabajo.
+
+Cada tarea guarda sus métricas: ejecuciones, errores, duración y resultado
+de la última corrida, y acumulados de los contadores que devuelve.
+Las mismas funciones se pueden correr a mano como comandos CLI.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger("votaciones.tareas")
+
+
+class TareaPeriodica:
+    def __init__(self, app, nombre, intervalo, funcion):
+        """funcion() -> dict de contadores (p. ej. {"borrados": 10}); corre dentro de app_context."""
+        self.app = app
+        self.nombre = nombre
+        self.intervalo = intervalo
+        self.funcion = funcion
+        self._lock = threading.Lock()
+        self._pid = None
+
+        self.ejecuciones = 0
+        self.errores = 0
+        self.ultima_ejecucion = None
+        self.ultima_duracion_ms = None
+        self.ultimo_resultado = None
+        self.ultimo_error = None
+        self.acumulado = {}
+
+    def ejecutar(self):
+        """Una corrida (también la usan los comandos CLI). Devuelve el resultado."""
+        inicio = time.perf_counter()
+        try:
+            with self.app.app_context():
+                resultado = self.funcion() or {}
+        except Exception as e:
+            with self._lock:
+                self.errores += 1
+                self.ultimo_error = str(e)[:300]
+            log.error("Error en tarea periódica", extra={"tarea": self.nombre, "error": str(e)})
+            raise
+        finally:
+            duracion = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                self.ejecuciones += 1
+                self.ultima_ejecucion = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+                self.ultima_duracion_ms = round(duracion, 1)
+
+        with self._lock:
+            self.ultimo_resultado = resultado
+            for clave, valor in resultado.items():
+                if isinstance(valor, (int, float)):
+                    self.acumulado[clave] = self.acumulado.get(clave, 0) + valor
+        return resultado
+
+    def asegurar_hilo(self):
+        if self.intervalo <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._bucle, name=f"tarea-{self.nombre}", daemon=True).start()
+
+    def _bucle(self):
+        # Desfase aleatorio: los workers no corren todos en el mismo instante
+        time.sleep(random.uniform(0, min(self.intervalo, 30)))
+        while True:
+            try:
+                self.ejecutar()
+            except Exception:
+                pass  # ya registrado; se reintenta en la próxima vuelta
+            time.sleep(self.intervalo)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "intervalo_segundos": self.intervalo,
+                "ejecuciones": self.ejecuciones,
+                "errores": self.errores,
+                "ultima_ejecucion": self.ultima_ejecucion,
+                "ultima_duracion_ms": self.ultima_duracion_ms,
+                "ultimo_resultado": self.ultimo_resultado,
+                "ultimo_error": self.ultimo_error,
+                "acumulado": dict(self.acumulado),
+            }
@@ -0,0 +1,173 @@
+# ---------------------------
+# Cliente HTTP para la API de 360dialog
+# ---------------------------
+"""
+Un solo cliente para todos los envíos a 360dialog.
+
+Usa una `requests.Session` compartida por proceso con pool de conexiones
+keep-alive (evita un handshake TCP+TLS por mensaje), timeouts separados de
+conexión/lectura y reintentos solo ante fallos de conexión (un POST que ya
+llegó al proveedor no se repite aquí; eso lo decide la cola de salida).
+Cada llamada registra su latencia.
+
+Antes de cada envío se pide un token al limitador (global y por destinatario)
+para no pasar los límites de 360dialog; si no hay, se lanza LimiteExcedido.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from limitador import LimiteExcedido
+
+log = logging.getLogger("votaciones.whatsapp_api")
+
+WABA_API_URL = os.environ.get("WABA_API_URL", "https://waba-v2.360dialog.io/messages")
+
+
+class ClienteWhatsapp:
+    def __init__(self, url=WABA_API_URL):
+        self.url = url
+        self.pool = int(os.environ.get("WHATSAPP_HTTP_POOL", "10"))
+        self.timeout = (
+            float(os.environ.get("WHATSAPP_HTTP_TIMEOUT_CONEXION", "3")),
+            float(os.environ.get("WHATSAPP_HTTP_TIMEOUT_LECTURA", "10")),
+        )
+        self.reintentos_conexion = int(os.environ.get("WHATSAPP_HTTP_REINTENTOS", "2"))
+
+        # Límites de envío: (capacidad de ráfaga, tokens por segundo)
+        self.limitador = None  # LimitadorDB / LimitadorMemoria (se asigna desde app.py)
+        self.metricas = None  # Metricas (se asigna desde app.py)
+        self.limite_global = (
+            float(os.environ.get("WHATSAPP_LIMITE_GLOBAL_RAFAGA", "50")),
+            float(os.environ.get("WHATSAPP_LIMITE_GLOBAL_POR_SEG", "50")),
+        )
+        self.limite_destino = (
+            float(os.environ.get("WHATSAPP_LIMITE_DESTINO_RAFAGA", "3")),
+            float(os.environ.get("WHATSAPP_LIMITE_DESTINO_POR_MIN", "10")) / 60.0,
+        )
+
+        self._lock = threading.Lock()
+        self._sesion = None
+        self._pid = None
+
+        # Latencias (ms) de las llamadas de este proceso
+        self.llamadas = 0
+        self.errores = 0
+        self.latencia_total_ms = 0.0
+        self.latencia_max_ms = 0.0
+
+    def sesion(self):
+        """Sesión con pool keep-alive; una por proceso (no se comparte tras un fork)."""
+        if self._sesion is None or self._pid != os.getpid():
+            with self._lock:
+                if self._sesion is None or self._pid != os.getpid():
+                    sesion = requests.Session()
+                    reintentos = Retry(
+                        total=self.reintentos_conexion,
+                        connect=self.reintentos_conexion,
+                        read=0,
+                        status=0,
+                        allowed_methods=None,
+                        backoff_factor=0.2,
+                    )
+                    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool,
+                                            max_retries=reintentos, pool_block=False)
+                    sesion.mount("https://", adaptador)
+                    sesion.mount("http://", adaptador)
+                    self._sesion = sesion
+                    self._pid = os.getpid()
+        return self._sesion
+
+    def limitar(self, numero):
+        """
+        Consume un token del destinatario y uno global o lanza LimiteExcedido.
+        El del destinatario va primero: un número que escribe de más se frena
+        sin gastar cupo global; si el global no alcanza, se le devuelve el suyo.
+        """
+        if self.limitador is None:
+            return
+        clave_destino = f"whatsapp:{numero}"
+        espera = self.limitador.adquirir(clave_destino, *self.limite_destino)
+        if espera > 0:
+            raise LimiteExcedido(clave_destino, espera)
+        espera = self.limitador.adquirir("whatsapp:global", *self.limite_global)
+        if espera > 0:
+            self.limitador.devolver(clave_destino, self.limite_destino[0])
+            raise LimiteExcedido("whatsapp:global", espera)
+
+    def enviar_texto(self, numero, mensaje):
+        """
+        Envía un texto. Devuelve (ok, reintentable, detalle):
+        429 / 5xx / errores de red se pueden reintentar, el resto no.
+        Si ok, `detalle` es el id del mensaje (wamid) para cruzar los
+        callbacks de estado.
+        Lanza LimiteExcedido si no hay cupo (no se llegó a llamar a 360dialog).
+        """
+        token = os.environ.get("WABA_TOKEN")
+        if not token:
+            log.warning("WABA_TOKEN no está configurado")
+            return False, True, "WABA_TOKEN no configurado"
+
+        self.limitar(numero)
+
+        inicio = time.perf_counter()
+        try:
+            resp = self.sesion().post(
+                self.url,
+                headers={
+                    "Content-Type": "application/json",
+                    "D360-API-KEY": token
+                },
+                json={
+                    "messaging_product": "whatsapp",
+                    "recipient_type": "individual",
+                    "to": numero,
+                    "type": "text",
+                    "text": {"preview_url": False, "body": mensaje}
+                },
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            self._registrar(inicio, error=True, codigo="error_red")
+            return False, True, str(e)
+
+        ms = self._registrar(inicio, error=not (200 <= resp.status_code < 300), codigo=resp.status_code)
+        if 200 <= resp.status_code < 300:
+            log.debug("Envío a 360dialog", extra={"codigo": resp.status_code, "duracion_ms": round(ms, 1)})
+            try:
+                wamid = ((resp.json().get("messages") or [{}])[0] or {}).get("id") or ""
+            except ValueError:
+                wamid = ""
+            return True, False, wamid
+        reintentable = resp.status_code == 429 or resp.status_code >= 500
+        log.warning("Envío a 360dialog rechazado", extra={
+            "codigo": resp.status_code, "duracion_ms": round(ms, 1), "respuesta": resp.text[:200],
+        })
+        return False, reintentable, f"{resp.status_code} - {resp.text[:200]}"
+
+    def _registrar(self, inicio, error, codigo):
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.llamadas += 1
+            self.errores += int(error)
+            self.latencia_total_ms += ms
+            self.latencia_max_ms = max(self.latencia_max_ms, ms)
+        if self.metricas is not None:
+            self.metricas.observar("whatsapp_api_duracion_segundos", ms / 1000)
+            self.metricas.sumar("whatsapp_api_llamadas_total", codigo=codigo)
+        return ms
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "llamadas": self.llamadas,
+                "errores": self.errores,
+                "latencia_promedio_ms": round(self.latencia_total_ms / self.llamadas, 1) if self.llamadas else None,
+                "latencia_max_ms": round(self.latencia_max_ms, 1),
+                "pool": self.pool,
+            }